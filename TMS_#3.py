@@ -3,48 +3,44 @@ import sys
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 import tkinter as tk
-from openpyxl import Workbook, load_workbook
+from openpyxl import Workbook
 from tkinter import messagebox, filedialog
 import sqlite3
 from collections import defaultdict
 from datetime import datetime
-from scipy.optimize import linprog
 import threading
+import queue
+import multiprocessing
 import time
 from PIL import Image, ImageTk
 import folium
 import webbrowser
 import requests
+import tms_engine
+from tms_engine import (DATABASE_PATH, EXCLUDED_CARRIERS_DB, AVAILABLE_TRUCKS_DB, CARRIER_ASSIGNMENT_DB,
+                        RATE_CACHE_DIR, PERFORMANCE_LOG_PATH, PLAN_STAGES, PlanningError, PlanningCancelled,
+                        RateCatalog, ShippingEngine, describe_solve)
+from tms_excel import TEMPLATE_HEADERS, read_demands, write_results_workbook
+from tms_server import PlanningClient
 
-DATABASE_PATH = "//10.193.232.18/Java/우현 테스트/data_needed"
-EXCLUDED_CARRIERS_DB = f"{DATABASE_PATH}/excluded_carriers.db"
-AVAILABLE_TRUCKS_DB = f"{DATABASE_PATH}/available_trucks.db"
-SHIPPING_POSTAL_CODES_DB = f"{DATABASE_PATH}/shipping_postal_codes.db"
-CARRIER_ASSIGNMENT_DB = f"{DATABASE_PATH}/Carrier_assignment.db"
+RESULT_CHUNK_SIZE = 200  # 결과 Treeview에 한 번에 추가하는 우편번호 그룹 수
+RESULT_EXPAND_LIMIT = 300  # 배차 행이 이 수 이하이면 모든 그룹을 펼쳐서 표시
+PLANNING_SERVICE_URL = os.environ.get("TMS_SERVICE_URL")  # 설정하면 계산과 저장을 계획 서비스(tms_server.py)에 요청
+PLANNING_SERVICE_TOKEN = os.environ.get("TMS_SERVICE_TOKEN")  # 계획 서비스에 저장할 때 보내는 공유 토큰
 
-class DatabaseManager:
-    def __init__(self, db_path):
-        self.db_path = db_path
-        self.conn = None
+class DatabaseManager(tms_engine.DatabaseManager):
+    """오류를 메시지 박스로 표시하는 GUI용 DatabaseManager"""
 
     def connect(self):
         try:
-            self.conn = sqlite3.connect(self.db_path)
-            return self.conn
+            return super().connect()
         except sqlite3.Error as e:
             messagebox.showerror("Database Error", f"Failed to connect to database: {e}")
             return None
 
-    def close(self):
-        if self.conn:
-            self.conn.close()
-
     def execute_query(self, query, params=()):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(query, params)
-            self.conn.commit()
-            return cursor
+            return super().execute_query(query, params)
         except sqlite3.Error as e:
             messagebox.showerror("Database Error", f"Failed to execute query: {e}")
             return None
@@ -59,8 +55,6 @@ class ShippingCalculator:
 
         self.setup_start_interface()
 
-        self.excluded_carriers = set()
-        self.input_destination = {}  # 입력값을 관리하는 딕셔너리
         self.destination_entries = []
         self.truck_entries = []
         self.truck_type_vars = []
@@ -68,124 +62,49 @@ class ShippingCalculator:
 
         self.excluded_carriers_db = DatabaseManager(EXCLUDED_CARRIERS_DB)
         self.available_trucks_db = DatabaseManager(AVAILABLE_TRUCKS_DB)
-        self.shipping_postal_codes_db = DatabaseManager(SHIPPING_POSTAL_CODES_DB)
         self.carrier_assignment_db = DatabaseManager(CARRIER_ASSIGNMENT_DB)
 
+        # 운임 조회와 최적화는 GUI와 분리된 엔진에서 처리
+        # 운임 DB는 로컬 사본에서 읽고, 공유 폴더의 원본이 바뀐 경우에만 다시 복사
+        self.engine = ShippingEngine(DATABASE_PATH, cache_dir=RATE_CACHE_DIR)
+        self.engine.decompose = True  # 큰 계획은 트럭 타입별 부분 문제로 나눠 여러 코어에서 풂
+        # 계획 서비스가 설정되어 있으면 계산과 저장만 서비스에 맡김 (조회 화면은 계속 DB를 직접 읽음)
+        self.planner = (PlanningClient(PLANNING_SERVICE_URL, token=PLANNING_SERVICE_TOKEN) if PLANNING_SERVICE_URL
+                        else self.engine)
+        self.plan_cancel_event = None  # 계산 중일 때만 설정 (Cancel 버튼으로 set)
+
         # 하드 코딩
         #self.excluded_carriers_db = DatabaseManager("C:/Users/SISTEMAS/Documents/excluded_carriers.db")
         #self.available_trucks_db = DatabaseManager("C:/Users/SISTEMAS/Documents/available_trucks.db")
-        #self.shipping_postal_codes_db = DatabaseManager("C:/Users/SISTEMAS/Documents/shipping_postal_codes.db")
         #self.carrier_assignment_db = DatabaseManager("C:/Users/SISTEMAS/Documents/Carrier_assignment.db")
 
-        self.init_db()
-
-    def init_db(self):
-        self.excluded_carriers_db.connect()
-        self.excluded_carriers_db.execute_query('''
-            CREATE TABLE IF NOT EXISTS excluded_carriers (
-                carrier TEXT,
-                destination_postal_code INTEGER,
-                PRIMARY KEY (carrier, destination_postal_code)
-            )
-        ''')
-        self.excluded_carriers_db.close()
-
-        # Carrier_assignment 테이블이 있는지 확인
-        self.carrier_assignment_db.connect()
-        self.carrier_assignment_db.execute_query('''
-            CREATE TABLE IF NOT EXISTS Carrier_assignment (
-                postal_code INTEGER,
-                carrier TEXT,
-                type TEXT,
-                assigned_truck INTEGER
-            )
-        ''')
-        self.carrier_assignment_db.close()
-
-    def get_assigned_trucks(self):
-        """Carrier_assignment 테이블에서 이미 할당된 트럭 수를 계산하는 함수"""
-        assigned_trucks = defaultdict(lambda: defaultdict(int))  # carrier -> truck_type -> assigned_trucks
-        self.carrier_assignment_db.connect()
-
         try:
-            cursor = self.carrier_assignment_db.execute_query(
-                'SELECT carrier, type, SUM(assigned_truck) FROM Carrier_assignment GROUP BY carrier, type')
-            rows = cursor.fetchall()
-
-            # 각 운송사 및 트럭 타입별로 할당된 트럭 수를 기록
-            for row in rows:
-                carrier = row[0]
-                truck_type = row[1]
-                total_assigned = row[2]
-                assigned_trucks[carrier][truck_type] = total_assigned
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to retrieve assigned trucks: {e}")
-        finally:
-            self.carrier_assignment_db.close()
-
-        return assigned_trucks
+            self.engine.init_db()
+        except PlanningError as e:
+            messagebox.showerror(e.title, str(e))
 
     def save_to_database(self, all_results, tree):
         """최적화된 결과를 데이터베이스에 저장하는 함수"""
-        self.carrier_assignment_db.connect()
-        self.available_trucks_db.connect()
-
         try:
-            tree_children = tree.get_children()  # Treeview에 출력된 모든 항목을 가져옴
-            if not tree_children:
-                messagebox.showwarning("Warning", "No items to save.")
-                return
-
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # 현재 날짜와 시간 가져오기
-
-            for i, child in enumerate(tree_children):
-                item_values = tree.item(child, 'values')  # 각 항목의 값 가져오기
-                input_postal_code = item_values[0]  # Postal code
-                carrier = item_values[1]  # Carrier
-                truck_type = item_values[2]  # Truck type
-                assigned_truck = int(item_values[3])  # Assigned truck
+            saved_rows = self.planner.save_assignments(all_results)
+        except PlanningError as e:
+            messagebox.showerror(e.title, str(e))
+            return
 
-                # Carrier_assignment에 할당 정보 저장
-                self.carrier_assignment_db.execute_query(
-                    'INSERT INTO Carrier_assignment (postal_code, carrier, type, assigned_truck, Time) VALUES (?, ?, ?, ?, ?)',
-                    (input_postal_code, carrier, truck_type, assigned_truck, current_time)
-                )
+        if not saved_rows:
+            messagebox.showwarning("Warning", "No items to save.")
+            return
 
-                # Available_trucks에서 해당 운송사와 트럭 타입의 트럭 수를 업데이트
-                cursor = self.available_trucks_db.execute_query(
-                    'SELECT total_trucks FROM available_trucks WHERE carrier = ? AND truck_type = ?',
-                    (carrier, truck_type)
-                )
-                result = cursor.fetchone()
-                if result:
-                    available_trucks = result[0]
-                    new_total_trucks = available_trucks - assigned_truck
-
-                    # 남은 트럭 수가 0 이상이어야 함
-                    if new_total_trucks < 0:
-                        messagebox.showerror("Error", f"Not enough trucks available for {carrier} ({truck_type})")
-                        return
-
-                    # 트럭 수 업데이트
-                    self.available_trucks_db.execute_query(
-                        'UPDATE available_trucks SET total_trucks = ? WHERE carrier = ? AND truck_type = ?',
-                        (new_total_trucks, carrier, truck_type)
-                    )
-
-                # Treeview 항목에 태그를 추가하여 색상 변경 (저장 완료를 표시)
+        # Treeview 항목에 태그를 추가하여 색상 변경 (저장 완료를 표시, 색상은 setup_result_view에서 설정)
+        # 아직 펼치지 않은 그룹의 상세 행은 추가될 때 태그가 붙음
+        self.result_saved = True
+        for group in tree.get_children():
+            tree.item(group, tags=("group", "saved"))
+            for child in tree.get_children(group):
                 tree.item(child, tags=("saved",))
 
-            # 성공 메시지 표시
-            messagebox.showinfo("Success", "All data has been successfully saved to the database.")
-
-            # 저장된 항목들의 색상을 변경 (예: 녹색)
-            tree.tag_configure('saved', foreground='green')
-
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to save data: {e}")
-        finally:
-            self.carrier_assignment_db.close()
-            self.available_trucks_db.close()
+        # 성공 메시지 표시
+        messagebox.showinfo("Success", "All data has been successfully saved to the database.")
 
     def reset_carrier_assignment_db(self):
         """Carrier_assignment.db의 데이터를 날짜별로 리셋하는 함수"""
@@ -226,47 +145,13 @@ class ShippingCalculator:
                                                        f"Do you want to reset assignments for {selected}?")
                     if confirmation:
                         try:
-                            self.carrier_assignment_db.connect()
-
-                            # 선택한 날짜에 해당하는 할당된 트럭 수를 가져옵니다.
-                            cursor = self.carrier_assignment_db.execute_query(
-                                'SELECT carrier, type, SUM(assigned_truck) FROM Carrier_assignment WHERE Time = ? GROUP BY carrier, type',
-                                (selected,)
-                            )
-                            assigned_trucks = cursor.fetchall()
-
-                            # 해당 트럭 수를 available_trucks.db에 다시 더해줍니다.
-                            self.available_trucks_db.connect()
-                            for row in assigned_trucks:
-                                carrier = row[0]
-                                truck_type = row[1]
-                                assigned_truck = row[2]
-
-                                # 남은 트럭 수를 업데이트
-                                cursor = self.available_trucks_db.execute_query(
-                                    'SELECT total_trucks FROM available_trucks WHERE carrier = ? AND truck_type = ?',
-                                    (carrier, truck_type)
-                                )
-                                result = cursor.fetchone()
-                                if result:
-                                    available_trucks = result[0]
-                                    new_total_trucks = available_trucks + assigned_truck
-                                    self.available_trucks_db.execute_query(
-                                        'UPDATE available_trucks SET total_trucks = ? WHERE carrier = ? AND truck_type = ?',
-                                        (new_total_trucks, carrier, truck_type)
-                                    )
-
-                            # 선택한 날짜의 데이터 삭제
-                            self.carrier_assignment_db.execute_query(
-                                'DELETE FROM Carrier_assignment WHERE Time = ?', (selected,))
+                            # 트럭 수 복구와 삭제를 하나의 트랜잭션으로 처리
+                            self.engine.release_assignments(selected)
                             messagebox.showinfo("Success", f"All assignments for {selected} have been reset.")
                             date_window.destroy()
 
-                        except sqlite3.Error as e:
-                            messagebox.showerror("Database Error", f"Failed to reset data: {e}")
-                        finally:
-                            self.carrier_assignment_db.close()
-                            self.available_trucks_db.close()
+                        except PlanningError as e:
+                            messagebox.showerror(e.title, str(e))
 
                 else:
                     messagebox.showwarning("Selection Error", "Please select a date.")
@@ -362,47 +247,13 @@ class ShippingCalculator:
 
         if confirmation:
             try:
-                self.carrier_assignment_db.connect()
-
-                # 삭제할 트럭 수를 가져옵니다.
-                cursor = self.carrier_assignment_db.execute_query(
-                    'SELECT carrier, type, assigned_truck FROM Carrier_assignment WHERE postal_code = ? AND carrier = ?',
-                    (postal_code, carrier)
-                )
-                assignment = cursor.fetchone()
-
-                if assignment:
-                    truck_type = assignment[1]
-                    assigned_truck = assignment[2]
-
-                    # available_trucks.db에 트럭 수를 복구합니다.
-                    self.available_trucks_db.connect()
-                    cursor = self.available_trucks_db.execute_query(
-                        'SELECT total_trucks FROM available_trucks WHERE carrier = ? AND truck_type = ?',
-                        (carrier, truck_type)
-                    )
-                    result = cursor.fetchone()
-                    if result:
-                        available_trucks = result[0]
-                        new_total_trucks = available_trucks + assigned_truck
-                        self.available_trucks_db.execute_query(
-                            'UPDATE available_trucks SET total_trucks = ? WHERE carrier = ? AND truck_type = ?',
-                            (new_total_trucks, carrier, truck_type)
-                        )
-
-                    # Carrier_assignment.db에서 할당을 삭제합니다.
-                    self.carrier_assignment_db.execute_query(
-                        'DELETE FROM Carrier_assignment WHERE postal_code = ? AND carrier = ?',
-                        (postal_code, carrier)
-                    )
+                # 지우는 모든 행의 트럭 수를 available_trucks.db에 복구하고 삭제 (하나의 트랜잭션)
+                if self.engine.delete_assignment(postal_code, carrier):
                     messagebox.showinfo("Success", "The assignment has been deleted.")
                     tree.delete(selected_item)
 
-            except sqlite3.Error as e:
-                messagebox.showerror("Database Error", f"Failed to delete the assignment: {e}")
-            finally:
-                self.carrier_assignment_db.close()
-                self.available_trucks_db.close()
+            except PlanningError as e:
+                messagebox.showerror(e.title, str(e))
 
     def get_excluded_carriers(self):
         """데이터베이스에서 제외된 운송사 목록을 가져오는 함수"""
@@ -444,74 +295,11 @@ class ShippingCalculator:
         self.excluded_carriers_db.execute_query('DELETE FROM excluded_carriers')
         self.excluded_carriers_db.close()
 
-    def fetch_shipping_rates(self, destination, truck_types):
-        """해당 목적지와 트럭 타입에 대한 운송사 정보를 가져오는 함수"""
-        self.shipping_postal_codes_db.connect()
-        data = []
-        try:
-            cursor = self.shipping_postal_codes_db.conn.cursor()
-            for truck_type in truck_types:
-                cursor.execute(
-                    '''SELECT carrier, vehicle_type, origin, start_postal_code, end_postal_code, cost 
-                       FROM shipping_postal_codes 
-                       WHERE ? BETWEEN start_postal_code AND end_postal_code AND vehicle_type = ?''',
-                    (destination, truck_type)
-                )
-                data.extend(cursor.fetchall())
-
-            # 특정 input postal code에 대한 운송사만 제외 (범위 제외 대신)
-            data = [row for row in data if (row[0], destination) not in self.excluded_carriers]
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to retrieve shipping rates: {e}")
-            return None
-        finally:
-            self.shipping_postal_codes_db.close()
-
-        # 중복된 carrier, vehicle_type, cost 조합을 제거
-        unique_data = set()  # 중복 확인을 위한 세트
-        filtered_data = []
-
-        for row in data:
-            key = (row[0], row[1], row[5])  # carrier, vehicle_type, cost 조합으로 중복 체크
-            if key not in unique_data:
-                unique_data.add(key)  # 중복되지 않으면 추가
-                filtered_data.append(row)  # 데이터 저장
-
-        return filtered_data
-
-    def fetch_carrier_limits(self, carriers, truck_types):
-        """운송사와 트럭 타입별 최대 배차 가능 수를 계산하는 함수"""
-        carrier_limits = defaultdict(lambda: defaultdict(int))  # carrier -> truck_type -> limit
-        assigned_trucks = self.get_assigned_trucks()  # 이미 할당된 트럭 수를 가져옴
-        self.available_trucks_db.connect()
-
-        try:
-            cursor = self.available_trucks_db.conn.cursor()
-            query = '''
-                SELECT carrier, truck_type, SUM(total_trucks) FROM available_trucks 
-                WHERE carrier IN ({carrier_seq}) AND truck_type IN ({truck_type_seq})
-                GROUP BY carrier, truck_type
-            '''
-            # carriers와 truck_types를 각각의 쿼리에 맞게 placeholders로 설정
-            query = query.format(
-                carrier_seq=','.join('?' * len(carriers)),
-                truck_type_seq=','.join('?' * len(truck_types))
-            )
-            cursor.execute(query, carriers + truck_types)
-
-            for carrier, truck_type, limit in cursor.fetchall():
-                # 사용 가능한 트럭 수에서 이미 할당된 트럭 수를 차감
-                available_limit = limit - assigned_trucks.get((carrier, truck_type), 0)
-                carrier_limits[carrier][truck_type] = max(available_limit, 0)  # 음수가 되지 않도록 함
-
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", f"Failed to retrieve carrier limits: {e}")
-        finally:
-            self.available_trucks_db.close()
-
-        return carrier_limits
-
     def calculate_optimal_shipping(self):
+        """입력값으로 최적 배차를 작업 스레드에서 계산하고 단계별 진행 상태를 표시하는 함수"""
+        if self.plan_cancel_event is not None:
+            return  # 이미 계산 중
+
         try:
             raw_input_destination = [
                 {
@@ -522,129 +310,120 @@ class ShippingCalculator:
                 for i, (label, entry) in enumerate(self.destination_entries)
                 if entry.get().strip()
             ]
-
-            # 동일한 postal code와 truck type을 합산
-            combined_routes = defaultdict(lambda: {'trucks': 0, 'postal_code': None, 'truck_type': None})
-
-            for entry in raw_input_destination:
-                key = (entry['postal_code'], entry['truck_type'])  # postal code와 truck type을 키로 사용
-                combined_routes[key]['trucks'] += entry['trucks']  # 트럭 수 합산
-                combined_routes[key]['postal_code'] = entry['postal_code']
-                combined_routes[key]['truck_type'] = entry['truck_type']
-
-            self.input_destination = list(combined_routes.values())
-
-            if not self.input_destination:
-                messagebox.showerror("Error",
-                                     "Please enter all fields including destination, truck count, and truck type.")
-                return
-
-            self.excluded_carriers.update(self.get_excluded_carriers())
-
-            # 모든 입력 데이터를 통합하여 처리할 수 있도록 데이터 모으기
-            all_data = []
-            truck_requirements = []
-            route_ids = []
-
-            for entry in self.input_destination:
-                destination = entry['postal_code']
-                truck_type = entry['truck_type']
-                required_trucks = entry['trucks']
-
-                # 각 입력에 대한 데이터를 가져옴
-                data = self.fetch_shipping_rates(destination, [truck_type])
-                if not data:
-                    messagebox.showerror("Error",
-                                         f"No data found for the postal code {destination} and truck type {truck_type}.")
-                    continue
-
-                for d in data:
-                    # input_postal_code와 트럭 타입을 각 데이터에 추가
-                    d = list(d) + [destination, truck_type]
-                    all_data.append(d)
-
-                truck_requirements.append(required_trucks)
-                route_ids.append((destination, truck_type))  # 고유한 루트 식별자
-
-            # 최적화 과정은 전체 데이터를 대상으로 한 번에 실행
-            result = self.optimize_shipping(all_data, truck_requirements, route_ids)
-
-            if result:
-                # 결과를 각 입력값에 대해 구분하여 출력
-                self.display_results(result)
-                self.all_results = result # 최적화 결과를 클래스 변수로 저장
-            else:
-                messagebox.showerror("Optimization Error", "Failed to find an optimal solution.")
-
         except ValueError as e:
             messagebox.showerror("Input Error", f"Invalid input: {e}")
-        except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
-
-    def optimize_shipping(self, all_data, truck_requirements, route_ids):
-        try:
-            c = [row[5] for row in all_data]  # 운임 (cost) 벡터
-            carriers = [row[0] for row in all_data]  # 운송사
-            vehicle_types = [row[1] for row in all_data]  # 트럭 타입
-            input_postal_codes = [row[6] for row in all_data]  # 각 데이터의 목적지
-            input_truck_types = [row[7] for row in all_data]  # 각 데이터의 트럭 타입
-            num_data = len(all_data)
-
-            # 각 루트별 제약 조건 행렬 설정
-            A_eq = []
-            b_eq = []
-
-            for i, required_trucks in enumerate(truck_requirements):
-                route_postal_code, route_truck_type = route_ids[i]
-                row = [0] * num_data
-                for j in range(num_data):
-                    if input_postal_codes[j] == route_postal_code and input_truck_types[j] == route_truck_type:
-                        row[j] = 1
-                A_eq.append(row)
-                b_eq.append(required_trucks)
-
-            # 운송사 및 트럭 타입별로 제한을 설정
-            carrier_limits = self.fetch_carrier_limits(carriers, vehicle_types)
-            A_ub, b_ub = [], []
-            if carrier_limits:
-                for i, (carrier, truck_type) in enumerate(zip(carriers, vehicle_types)):
-                    limit = carrier_limits.get(carrier, {}).get(truck_type, 0)
-                    row = [1 if carriers[j] == carrier and vehicle_types[j] == truck_type else 0 for j in
-                           range(num_data)]
-                    A_ub.append(row)
-                    b_ub.append(limit)
-
-            bounds = [(0, None) for _ in range(num_data)]
-
-            result = linprog(c, A_eq=A_eq, b_eq=b_eq, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method='highs')
-
-            if result.success:
-                return {
-                    'carriers': carriers,
-                    'vehicle_types': vehicle_types,
-                    'input_postal_codes': input_postal_codes,
-                    'input_truck_types': input_truck_types,
-                    'assignments': result.x,
-                    'total_cost': result.fun,
-                    'costs': c
-                }
-            else:
-                messagebox.showerror("Optimization Failed", "Optimization failed.")
-                return None
+            return
 
-        except Exception as e:
-            messagebox.showerror("Optimization Error", f"An error occurred: {e}")
-            return None
+        def finish_plan(status, payload):
+            metrics = self.planner.last_metrics
+
+            if status == "cancelled":
+                self.hide_plan_progress()
+                self.write_performance_log(metrics)
+                return  # 취소된 계산의 결과는 버림
+            if status == "error":
+                self.hide_plan_progress()
+                self.write_performance_log(metrics)
+                messagebox.showerror(payload.title, str(payload))
+                return
 
-    def display_results(self, result):
-        # 기존에 표시된 결과 삭제
-        for widget in self.result_frame.winfo_children():
-            widget.destroy()
+            for destination, truck_type in payload['missing_routes']:
+                messagebox.showerror("Error",
+                                     f"No data found for the postal code {destination} and truck type {truck_type}.")
+
+            # 결과를 각 입력값에 대해 구분하여 출력 (나머지 행은 after()로 나눠서 추가되므로 첫 화면까지의 시간만 기록)
+            self.show_plan_stage("Render")
+            with metrics.stage("Render"):
+                self.display_results(payload)
+            self.all_results = payload # 최적화 결과를 클래스 변수로 저장
+            self.result_demands = raw_input_destination
+            self.hide_plan_progress()
+            self.write_performance_log(metrics)
+
+        # 운임 조회, 모델 구성, 풀이를 별도의 스레드에서 실행하여 UI가 멈추지 않도록 처리
+        self.start_planner_job(
+            lambda progress, cancel_event: self.planner.plan(raw_input_destination, progress=progress,
+                                                             cancel_event=cancel_event),
+            finish_plan)
+
+    def start_planner_job(self, job, on_done):
+        """job(progress, cancel_event)을 작업 스레드에서 실행하고 끝나면 Tk 스레드에서 on_done(status, payload)를 호출하는 함수
+
+        status는 "done", "error", "cancelled" 중 하나이며, 실행 중에는 진행 상태 표시줄을 보여주고 계산 버튼들을 비활성화합니다.
+        """
+        plan_queue = queue.Queue()  # 작업 스레드 -> Tk 스레드로 진행 단계와 결과를 전달
+        cancel_event = threading.Event()
+
+        def run_job():
+            # 작업 스레드에서는 계산만 하고 위젯은 건드리지 않음
+            try:
+                plan_queue.put(("done", job(lambda stage: plan_queue.put(("stage", stage)), cancel_event)))
+            except PlanningError as e:
+                plan_queue.put(("error", e))
+            except Exception as e:
+                plan_queue.put(("error", PlanningError(f"An unexpected error occurred: {e}")))
+
+        def poll_job():
+            while True:
+                try:
+                    status, payload = plan_queue.get_nowait()
+                except queue.Empty:
+                    self.root.after(50, poll_job)
+                    return
 
+                if status != "stage":
+                    break
+                self.show_plan_stage(payload)
+
+            self.plan_cancel_event = None
+            if cancel_event.is_set() or isinstance(payload, PlanningCancelled):
+                status = "cancelled"
+            on_done(status, payload)
+
+        self.plan_cancel_event = cancel_event
+        self.show_plan_progress()
+        threading.Thread(target=run_job, daemon=True).start()
+        self.root.after(50, poll_job)
+
+    def cancel_calculation(self):
+        """진행 중인 계산을 취소하는 함수 (풀이 중이면 엔진이 풀이를 중단)"""
+        if self.plan_cancel_event is not None:
+            self.plan_cancel_event.set()
+            self.plan_stage_label.config(text="Cancelling...")
+
+    def show_plan_progress(self):
+        """계산 진행 상태 표시줄을 보여주는 함수"""
+        self.calculate_button.config(state="disabled")
+        if self.what_if_button is not None:
+            self.what_if_button.config(state="disabled")
+        self.plan_progress_bar['value'] = 0
+        self.plan_stage_label.config(text="Starting...")
+        self.plan_progress_frame.grid()
+
+    def show_plan_stage(self, stage):
+        """현재 계산 단계를 진행 상태 표시줄에 표시하는 함수"""
+        stages = PLAN_STAGES + ("Render",)
+        if stage not in stages:
+            self.plan_stage_label.config(text=f"{stage}...")  # What-if 분석처럼 단계가 하나인 작업
+            return
+        step = stages.index(stage) + 1
+        self.plan_stage_label.config(text=f"{stage}... ({step}/{len(stages)})")
+        self.plan_progress_bar['value'] = step - 1
+
+    def hide_plan_progress(self):
+        """계산 진행 상태 표시줄을 숨기는 함수"""
+        self.plan_progress_frame.grid_remove()
+        self.calculate_button.config(state="normal")
+        if self.what_if_button is not None:
+            self.what_if_button.config(state="normal")
+
+    def setup_result_view(self):
+        """결과 Treeview, 스크롤바, 총 비용 라벨, Save/Exception 버튼을 한 번만 만드는 함수"""
         tree = ttk.Treeview(self.result_frame,
                             columns=("Input Postal Code", "Carrier", "Truck Type", "Assigned Trucks", "Cost"),
-                            show="headings")
+                            show="tree headings")
 
+        tree.column("#0", width=40, minwidth=40, stretch=False)  # 우편번호 그룹 펼치기/접기 표시
         tree.column("Input Postal Code", anchor="center", width=160, minwidth=160, stretch=False)
         tree.column("Carrier", anchor="center", width=160, minwidth=160, stretch=False)
         tree.column("Truck Type", anchor="center", width=160, minwidth=160, stretch=False)
@@ -657,28 +436,24 @@ class ShippingCalculator:
         tree.heading("Assigned Trucks", text="Assigned Trucks")
         tree.heading("Cost", text="Cost")
 
+        tree.tag_configure('group', font=('Arial', 10, 'bold'))
+        tree.tag_configure('saved', foreground='green')
+
         # 스크롤바 추가
         scrollbar = ttk.Scrollbar(self.result_frame, orient="vertical", command=tree.yview)
         tree.configure(yscroll=scrollbar.set)
         scrollbar.pack(side="right", fill="y")
         tree.pack(expand=True, fill="both")
 
-        total_cost = 0
+        self.total_cost_label = ttk.Label(self.result_frame, font=('Arial', 15, 'bold'))
+        self.total_cost_label.pack(pady=10)
 
-        for i, x in enumerate(result['assignments']):
-            if x > 0:
-                input_postal_code = result['input_postal_codes'][i]
-                input_truck_type = result['input_truck_types'][i]
-                tree.insert("", "end", values=(
-                    input_postal_code, result['carriers'][i], input_truck_type, int(x),
-                    f"${result['costs'][i] * x:,.2f}"))
-                total_cost += result['costs'][i] * x
-
-        total_cost_label = ttk.Label(self.result_frame, text=f"Total cost: ${total_cost:,.2f} (MXN)",
-                                     font=('Arial', 15, 'bold'))
-        total_cost_label.pack(pady=10)
+        # 풀이 방식과 시간, MIP 갭 표시 (시간 제한/갭 설정 조정용)
+        self.solver_label = ttk.Label(self.result_frame, font=('Arial', 10))
+        self.solver_label.pack()
 
         tree.bind("<Button-3>", lambda event: self.on_item_right_click(event, tree))
+        tree.bind("<<TreeviewOpen>>", lambda event: self.on_result_group_open(tree))
 
         # 데이터베이스 저장 버튼 추가
         db_save_button = ttk.Button(self.main_frame, text="Save",
@@ -690,6 +465,91 @@ class ShippingCalculator:
                                           bootstyle="warning")
         excluded_list_button.grid(row=1, column=3, sticky="e", padx=10, pady=10)
 
+        performance_button = ttk.Button(self.main_frame, text="Performance", command=self.show_performance_window,
+                                        bootstyle="info")
+        performance_button.grid(row=1, column=4, sticky="e", padx=10, pady=10)
+
+        self.what_if_button = ttk.Button(self.main_frame, text="What-if", command=self.show_what_if_window,
+                                         bootstyle="secondary")
+        self.what_if_button.grid(row=1, column=5, sticky="e", padx=10, pady=10)
+
+        self.result_tree = tree
+
+    def display_results(self, result):
+        """결과를 우편번호별 그룹으로 표시하는 함수 (기존 위젯을 재사용하고 행은 나눠서 추가)"""
+        if self.result_tree is None:
+            self.setup_result_view()
+        tree = self.result_tree
+
+        # 이전 결과를 그리는 중이었다면 중단하고 기존 행 삭제
+        if self.result_render_job is not None:
+            self.root.after_cancel(self.result_render_job)
+            self.result_render_job = None
+        tree.delete(*tree.get_children())
+        self.result_group_rows = {}
+        self.result_saved = False
+
+        # 배차된 행을 입력 우편번호별로 묶음
+        groups = defaultdict(list)  # input postal code -> 결과 인덱스 목록
+        total_cost = 0
+
+        for i, postal_code, _, _, _, cost in result['candidates'].rows(result['assignments']):
+            groups[postal_code].append(i)
+            total_cost += cost
+
+        self.total_cost_label.config(text=f"Total cost: ${total_cost:,.2f} (MXN)")
+        self.solver_label.config(text=describe_solve(result))
+
+        # 행이 적으면 모두 펼쳐서 표시하고, 많으면 그룹 요약만 먼저 표시한 뒤 펼칠 때 상세 행을 추가
+        expand = sum(len(indexes) for indexes in groups.values()) <= RESULT_EXPAND_LIMIT
+        self.insert_result_groups(result, list(groups.items()), 0, expand)
+
+    def insert_result_groups(self, result, groups, start, expand):
+        """우편번호 그룹 요약 행을 RESULT_CHUNK_SIZE개씩 after()로 나눠서 추가하는 함수"""
+        tree = self.result_tree
+        end = min(start + RESULT_CHUNK_SIZE, len(groups))
+
+        candidates, assignments = result['candidates'], result['assignments']
+        for postal_code, indexes in groups[start:end]:
+            assigned_trucks = sum(int(assignments[i]) for i in indexes)
+            cost = sum(candidates.costs[i] * assignments[i] for i in indexes)
+            truck_types = ", ".join(sorted({candidates.truck_type(i) for i in indexes}))
+
+            group = tree.insert("", "end", open=expand, tags=("group",), values=(
+                postal_code, f"{len(indexes)} carrier(s)", truck_types, assigned_trucks, f"${cost:,.2f}"))
+            self.result_group_rows[group] = (result, indexes)
+
+            if expand:
+                self.insert_result_rows(group)
+            else:
+                tree.insert(group, "end")  # 펼치기 표시를 위한 빈 행 (펼칠 때 실제 행으로 교체)
+
+        if end < len(groups):
+            self.result_render_job = self.root.after(1, self.insert_result_groups, result, groups, end, expand)
+        else:
+            self.result_render_job = None
+
+    def insert_result_rows(self, group):
+        """그룹 아래에 운송사별 상세 행을 추가하는 함수"""
+        tree = self.result_tree
+        result, indexes = self.result_group_rows.pop(group)
+        tags = ("saved",) if self.result_saved else ()
+
+        candidates = result['candidates']
+        for i in indexes:
+            x = result['assignments'][i]
+            tree.insert(group, "end", tags=tags, values=(
+                candidates.postal_code(i), candidates.carrier(i), candidates.truck_type(i), int(x),
+                f"${candidates.costs[i] * x:,.2f}"))
+
+    def on_result_group_open(self, tree):
+        """접혀 있던 그룹을 처음 펼칠 때 상세 행을 추가하는 함수"""
+        group = tree.focus()
+        if group not in self.result_group_rows:
+            return
+        tree.delete(*tree.get_children(group))
+        self.insert_result_rows(group)
+
     def on_item_right_click(self, event, tree):
         selected_items = tree.selection()
 
@@ -697,6 +557,9 @@ class ShippingCalculator:
             return
 
         selected_item = selected_items[0]
+        if not tree.parent(selected_item):
+            return  # 우편번호 그룹 요약 행은 운송사 정보가 없음
+
         values = tree.item(selected_item, "values")
         selected_carrier = values[1]  # Carrier 값을 가져옴
         input_postal_code = int(values[0])  # Input Postal Code 값을 가져옴
@@ -721,12 +584,14 @@ class ShippingCalculator:
 
         # Treeview 생성
         tree = ttk.Treeview(details_window,
-                            columns=("Carrier", "Truck Type", "Cost", "Available Limit", "Input Postal Code"),
+                            columns=("Carrier", "Truck Type", "Cost", "Available Limit", "Assigned",
+                                     "Input Postal Code"),
                             show="headings")
         tree.heading("Carrier", text="Carrier")
         tree.heading("Truck Type", text="Truck Type")  # 트럭 타입 열 추가
         tree.heading("Cost", text="Cost")
         tree.heading("Available Limit", text="Available Limit")  # 사용 가능한 트럭 수 열 추가
+        tree.heading("Assigned", text="Assigned")  # 이미 할당된 트럭 수 열 추가
         tree.heading("Input Postal Code", text="Input Postal Code")
 
         # 스크롤바 추가
@@ -736,15 +601,20 @@ class ShippingCalculator:
 
         tree.pack(expand=True, fill="both")
 
-        # 주어진 postal_code와 truck_type에 해당하는 운송사 데이터를 가져옴
-        shipping_data = self.fetch_shipping_rates(input_postal_code, [truck_type])
-
-        # 운송사 목록과 트럭 타입 목록을 모두 가져와 fetch_carrier_limits에 전달
-        carriers = [row[0] for row in shipping_data]
-        truck_types = [row[1] for row in shipping_data]
-
-        # 운송사 및 트럭 타입별로 사용 가능한 트럭 수를 가져옴
-        carrier_limits = self.fetch_carrier_limits(carriers, truck_types)  # 운송사별 사용 가능한 트럭 수
+        try:
+            # 주어진 postal_code와 truck_type에 해당하는 운송사 데이터를 가져옴
+            shipping_data = self.engine.fetch_shipping_rates(input_postal_code, [truck_type])
+
+            # 운송사 목록과 트럭 타입 목록을 모두 가져와 fetch_carrier_limits에 전달
+            carriers = [row[0] for row in shipping_data]
+            truck_types = [row[1] for row in shipping_data]
+
+            # 운송사 및 트럭 타입별로 사용 가능한 트럭 수를 가져옴
+            carrier_limits = self.engine.fetch_carrier_limits(carriers, truck_types)  # 운송사별 사용 가능한 트럭 수
+            assigned_trucks = self.engine.get_assigned_trucks()  # 운송사별 이미 할당된 트럭 수
+        except PlanningError as e:
+            messagebox.showerror(e.title, str(e))
+            return
 
         # 운임 비용 기준으로 정렬
         sorted_data = sorted(shipping_data, key=lambda x: x[5])
@@ -754,24 +624,201 @@ class ShippingCalculator:
             truck_type = row[1]  # 트럭 타입 추가
             cost = row[5]
             available_limit = carrier_limits.get(carrier, {}).get(truck_type, 0)  # 해당 운송사와 트럭 타입의 사용 가능한 트럭 수를 가져옴
-            tree.insert("", "end", values=(carrier, truck_type, f"${cost:,.2f}", available_limit, input_postal_code))
+            assigned = assigned_trucks.get(carrier, {}).get(truck_type, 0)
+            tree.insert("", "end", values=(carrier, truck_type, f"${cost:,.2f}", available_limit, assigned,
+                                           input_postal_code))
 
         details_window.geometry("1000x400")
 
+    def warn_if_planning(self):
+        """계산 중이면 경고를 표시하고 True를 돌려주는 함수 (작업 스레드가 엔진의 제외 목록을 읽는 동안 바꾸지 않음)"""
+        if self.plan_cancel_event is None:
+            return False
+        messagebox.showwarning("Calculation Running", "Please wait until the calculation finishes.")
+        return True
+
     def exclude_carrier(self, carrier, input_postal_code):
         """특정 input postal code에 대한 운송사를 제외 목록에 추가하고 알림을 표시합니다."""
+        if self.warn_if_planning():
+            return
+
         # 이미 존재하는지 확인
         existing_exclusions = self.get_excluded_carriers()
 
         # 특정 input postal code만 제외
         if (carrier, input_postal_code) not in existing_exclusions:
-            self.excluded_carriers.add((carrier, input_postal_code))
+            self.engine.excluded_carriers.add((carrier, input_postal_code))
             self.add_to_excluded_carriers(carrier, input_postal_code)  # 범위 대신 input postal code만 추가
             messagebox.showinfo("Excluded", f"{carrier} has been excluded for postal code {input_postal_code}.")
         else:
             messagebox.showinfo("Already Excluded",
                                 f"{carrier} is already excluded for postal code {input_postal_code}.")
 
+    def write_performance_log(self, metrics):
+        """계산의 성능 기록을 로그 파일에 추가하는 함수 (기록 실패는 계산 결과에 영향을 주지 않음)"""
+        if metrics is None:
+            return
+        try:
+            metrics.write_log(PERFORMANCE_LOG_PATH)
+        except OSError:
+            pass
+
+    def show_performance_window(self):
+        """마지막 계산의 단계별 시간, DB 호출, 풀이 통계를 보여주는 창 생성"""
+        performance_window = tk.Toplevel(self.root)
+        performance_window.title("Performance")
+
+        tree = ttk.Treeview(performance_window, columns=("item", "value", "detail"), show="tree headings")
+        tree.column("#0", width=30, stretch=False)
+        tree.column("item", width=220)
+        tree.column("value", anchor="e", width=120)
+        tree.column("detail", width=360)
+        tree.heading("item", text="Item")
+        tree.heading("value", text="Value")
+        tree.heading("detail", text="Detail")
+        tree.pack(expand=True, fill="both", padx=10, pady=10)
+
+        log_label = ttk.Label(performance_window, text=f"Log file: {PERFORMANCE_LOG_PATH}", font=("Arial", 9))
+        log_label.pack(pady=(0, 5))
+
+        refresh_button = ttk.Button(performance_window, text="Refresh",
+                                    command=lambda: self.fill_performance_tree(tree))
+        refresh_button.pack(pady=(0, 10))
+
+        self.fill_performance_tree(tree)
+
+    def fill_performance_tree(self, tree):
+        """Performance 창의 Treeview를 마지막 계산의 성능 기록으로 채우는 함수"""
+        tree.delete(*tree.get_children())
+
+        metrics = self.planner.last_metrics
+        if metrics is None:
+            tree.insert("", "end", values=("No calculation yet.", "", ""))
+            return
+        record = metrics.as_dict()
+
+        summary = tree.insert("", "end", open=True, values=("Calculation", record['time'], record['error'] or ""))
+        for key, value in record['plan'].items():
+            tree.insert(summary, "end", values=(key, value, ""))
+
+        stages = tree.insert("", "end", open=True, values=(
+            "Stages", f"{sum(record['stages'].values()) * 1000:,.1f} ms", ""))
+        for stage, seconds in record['stages'].items():
+            tree.insert(stages, "end", values=(stage, f"{seconds * 1000:,.1f} ms", ""))
+
+        totals = record['db_totals']
+        database = tree.insert("", "end", open=True, values=(
+            "Database", f"{totals['time'] * 1000:,.1f} ms", f"{totals['queries']} queries, {totals['rows']} rows"))
+        for call in record['db_calls']:
+            tree.insert(database, "end", values=(
+                f"{call['call']} ({call['db']})", f"{call['time'] * 1000:,.1f} ms",
+                f"{call['queries']} queries, {call['rows']} rows"))
+
+        solver = tree.insert("", "end", open=True, values=("Solver", record['solver'].get('solver', '').upper(), ""))
+        for key, value in record['solver'].items():
+            if key == 'solve_time':
+                tree.insert(solver, "end", values=(key, f"{value * 1000:,.1f} ms", ""))
+            elif isinstance(value, str):
+                tree.insert(solver, "end", values=(key, "", value))  # 상태 메시지
+            else:
+                tree.insert(solver, "end", values=(key, f"{value:,g}", ""))
+
+    def show_what_if_window(self):
+        """마지막 계산의 what-if 분석을 작업 스레드에서 계산하고 끝나면 결과 창을 여는 함수"""
+        if self.plan_cancel_event is not None:
+            return  # 이미 계산 중
+        if not self.result_demands:
+            messagebox.showwarning("No Data", "Please calculate a plan first.")
+            return
+
+        demands = self.result_demands
+
+        def job(progress, cancel_event):
+            progress("What-if analysis")
+            return self.planner.analyze_sensitivity(demands, cancel_event=cancel_event)
+
+        def finish_analysis(status, payload):
+            self.hide_plan_progress()
+            if status == "error":
+                messagebox.showerror(payload.title, str(payload))
+            elif status == "done":
+                self.open_what_if_window(payload)
+
+        self.start_planner_job(job, finish_analysis)
+
+    def open_what_if_window(self, analysis):
+        """쌍대값과 축소 비용으로 용량, 대안 운송사, 루트별 what-if 분석을 보여주는 창 생성"""
+        what_if_window = tk.Toplevel(self.root)
+        what_if_window.title("What-if Analysis")
+
+        summary_label = ttk.Label(what_if_window, font=("Arial", 10), text=(
+            f"Based on one LP solve (total cost ${analysis['total_cost']:,.2f}). "
+            f"Values hold for small changes; recalculate to confirm larger ones."))
+        summary_label.pack(pady=(10, 0))
+
+        notebook = ttk.Notebook(what_if_window)
+        notebook.pack(expand=True, fill="both", padx=10, pady=10)
+
+        def add_tab(title, columns):
+            frame = ttk.Frame(notebook)
+            notebook.add(frame, text=title)
+            tree = ttk.Treeview(frame, columns=columns, show="headings")
+            for column in columns:
+                tree.heading(column, text=column)
+                tree.column(column, anchor="center", width=140)
+            scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+            tree.configure(yscroll=scrollbar.set)
+            scrollbar.pack(side="right", fill="y")
+            tree.pack(expand=True, fill="both")
+            return frame, tree
+
+        # 용량: 모두 사용한 (carrier, truck type)과 트럭 1대를 더 얻을 때의 절감액 (큰 순서)
+        capacity_frame, capacity_tree = add_tab("Capacity", (
+            "Carrier", "Truck Type", "Available", "Used", "Binding", "Saving per Extra Truck"))
+        capacities = sorted(analysis['capacities'], key=lambda row: (-row[5], not row[4]))
+        for carrier, truck_type, limit, used, binding, value in capacities:
+            capacity_tree.insert("", "end", values=(carrier, truck_type, limit, used, "Yes" if binding else "",
+                                                    f"${value:,.2f}"))
+
+        # 선택한 운송사에 트럭을 더 줄 때의 예상 절감액
+        extra_frame = ttk.Frame(capacity_frame)
+        extra_frame.pack(fill="x", pady=5)
+        ttk.Label(extra_frame, text="Extra trucks:").pack(side="left", padx=5)
+        extra_trucks = tk.StringVar(value="1")
+        ttk.Entry(extra_frame, textvariable=extra_trucks, width=6).pack(side="left")
+        estimate_label = ttk.Label(extra_frame, text="Select a carrier to estimate the saving.")
+        estimate_label.pack(side="left", padx=10)
+
+        def update_estimate(*_):
+            selected = capacity_tree.selection()
+            if not selected:
+                return
+            carrier, truck_type, _, _, _, value = capacities[capacity_tree.index(selected[0])]
+            try:
+                count = int(extra_trucks.get())
+            except ValueError:
+                estimate_label.config(text="Please enter a whole number of trucks.")
+                return
+            estimate_label.config(text=f"{count} more {truck_type} truck(s) for {carrier}: "
+                                       f"estimated saving ${count * value:,.2f}")
+
+        capacity_tree.bind("<<TreeviewSelect>>", update_estimate)
+        extra_trucks.trace_add("write", update_estimate)
+
+        # 대안: 선택되지 않은 운송사의 운임이 얼마나 내려가야 선택되는지 (가까운 순서)
+        _, alternative_tree = add_tab("Alternatives", (
+            "Input Postal Code", "Truck Type", "Carrier", "Rate", "Cut Needed", "Break-even Rate"))
+        for postal_code, truck_type, carrier, cost, reduction, break_even in analysis['alternatives']:
+            alternative_tree.insert("", "end", values=(postal_code, truck_type, carrier, f"${cost:,.2f}",
+                                                       f"${reduction:,.2f}", f"${break_even:,.2f}"))
+
+        # 루트: 트럭 1대를 더 보낼 때의 비용 증가
+        _, route_tree = add_tab("Routes", ("Input Postal Code", "Truck Type", "Trucks", "Cost per Extra Truck"))
+        for postal_code, truck_type, trucks, marginal_cost in analysis['routes']:
+            route_tree.insert("", "end", values=(postal_code, truck_type, trucks, f"${marginal_cost:,.2f}"))
+
+        what_if_window.geometry("950x500")
+
     def show_excluded_list(self):
         """제외된 운송사 목록을 보여주는 창 생성"""
         excluded_window = tk.Toplevel(self.root)
@@ -813,6 +860,9 @@ class ShippingCalculator:
         menu.post(event.x_root, event.y_root)
 
     def restore_carrier(self, tree, item, carrier, postal_code):
+        if self.warn_if_planning():
+            return
+
         try:
             # 데이터베이스에서 항목 제거
             self.remove_from_excluded_carriers(carrier, postal_code)
@@ -827,7 +877,7 @@ class ShippingCalculator:
             self.excluded_carriers_db.close()
 
             if not result:
-                self.excluded_carriers = self.get_excluded_carriers()
+                self.engine.excluded_carriers = self.get_excluded_carriers()
                 self.refresh_treeview(tree)
                 messagebox.showinfo("Returned", f"{carrier} has been returned for postal code {postal_code}.")
             else:
@@ -851,8 +901,11 @@ class ShippingCalculator:
 
     def reset_excluded_list(self, tree):
         """제외 목록을 초기화하고 화면을 업데이트"""
+        if self.warn_if_planning():
+            return
+
         self.clear_excluded_carriers()
-        self.excluded_carriers.clear()
+        self.engine.excluded_carriers.clear()
         for item in tree.get_children():
             tree.delete(item)
         messagebox.showinfo("Reset", "Reset complete.")
@@ -872,37 +925,12 @@ class ShippingCalculator:
             return
 
         try:
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "Shipping Results"
-
-            # 엑셀 헤더 추가
-            ws.append(["Input Postal Code", "Carrier", "Truck Type", "Assigned Trucks", "Cost"])
-
-            # 결과 데이터를 엑셀에 추가
-            total_cost = 0
             if not isinstance(all_results, dict):
                 messagebox.showerror("Error", "Invalid result structure, expected dictionary of results.")
                 return
 
-            # all_results가 딕셔너리이므로 바로 필드를 처리
-            for i, x in enumerate(all_results['assignments']):
-                if x > 0:
-                    postal_code = all_results['input_postal_codes'][i]
-                    carrier = all_results['carriers'][i]
-                    truck_type = all_results['vehicle_types'][i]
-                    assigned_trucks = int(x)
-                    cost = all_results['costs'][i] * x
-
-                    ws.append([postal_code, carrier, truck_type, assigned_trucks, f"{cost:,.2f}"])
-                    total_cost += cost
-
-            # 총 비용을 엑셀에 추가
-            ws.append([])
-            ws.append(["", "", "", "Total Cost", f"{total_cost:,.2f}"])
-
-            # 엑셀 파일 저장
-            wb.save(file_path)
+            # 엑셀 파일 저장 (CLI와 동일한 형식)
+            write_results_workbook(all_results, file_path)
             messagebox.showinfo("Save Complete", f"The results were saved at {file_path}.")
 
         except PermissionError:
@@ -1032,6 +1060,12 @@ class ShippingCalculator:
         # 결과 프레임 설정
         self.result_frame = ttk.Frame(self.main_frame)
         self.result_frame.grid(row=0, column=1, padx=10, pady=10, sticky="nsew")
+        self.result_tree = None  # 첫 계산 결과를 표시할 때 생성
+        self.what_if_button = None  # 결과 화면과 함께 생성
+        self.result_render_job = None
+        self.result_group_rows = {}
+        self.result_saved = False
+        self.result_demands = None  # 표시 중인 결과의 입력 수요 (What-if 분석에 사용)
 
         add_button = ttk.Button(self.input_frame, text="Add Postal code", command=self.add_input_fields,
                                 bootstyle="success")
@@ -1041,9 +1075,24 @@ class ShippingCalculator:
                                    bootstyle="danger")
         remove_button.grid(row=0, column=2, columnspan=2, pady=(0, 10))
 
-        calculate_button = ttk.Button(self.input_frame, text="Calculate Optimal Cost",
-                                      command=self.calculate_optimal_shipping, bootstyle="primary")
-        calculate_button.grid(row=0, column=4, sticky="e", pady=(0, 10))
+        self.calculate_button = ttk.Button(self.input_frame, text="Calculate Optimal Cost",
+                                           command=self.calculate_optimal_shipping, bootstyle="primary")
+        self.calculate_button.grid(row=0, column=4, sticky="e", pady=(0, 10))
+
+        # 계산 진행 상태 표시줄 (계산 중에만 표시)
+        self.plan_progress_frame = ttk.Frame(self.main_frame)
+        self.plan_progress_frame.grid(row=1, column=0, columnspan=2, sticky="w", padx=10, pady=10)
+        self.plan_stage_label = ttk.Label(self.plan_progress_frame, font=("Arial", 11))
+        self.plan_stage_label.pack(side="left", padx=(0, 10))
+        self.plan_progress_bar = ttk.Progressbar(self.plan_progress_frame, mode='determinate',
+                                                 maximum=len(PLAN_STAGES) + 1, length=200)
+        self.plan_progress_bar.pack(side="left", padx=(0, 10))
+        cancel_button = ttk.Button(self.plan_progress_frame, text="Cancel", command=self.cancel_calculation,
+                                   bootstyle="danger")
+        cancel_button.pack(side="left")
+        self.plan_progress_frame.grid_remove()
+        if self.plan_cancel_event is not None:
+            self.show_plan_progress()  # 계산 중에 화면을 다시 만든 경우
 
         back_button = ttk.Button(self.main_frame, text="Back", command=self.back_to_start_from_main, bootstyle="danger")
         back_button.place(relx=1.0, rely=0.0, anchor="ne", x=-10, y=10)
@@ -1112,13 +1161,17 @@ class ShippingCalculator:
             trucks_entry.grid_forget()
             truck_type_menu.grid_forget()
 
+    def get_rate_catalog(self):
+        """우편번호/트럭 타입 카탈로그를 돌려주는 함수 (운임 DB가 바뀐 경우에만 엔진이 다시 로드)"""
+        try:
+            return self.engine.get_rate_catalog()
+        except PlanningError as e:
+            messagebox.showerror(e.title, str(e))
+            return RateCatalog([], [])
+
     def fetch_truck_types(self):
         """데이터베이스에서 트럭 타입 목록을 가져오는 함수"""
-        self.shipping_postal_codes_db.connect()
-        cursor = self.shipping_postal_codes_db.execute_query('SELECT DISTINCT vehicle_type FROM shipping_postal_codes')
-        truck_types = [row[0] for row in cursor.fetchall()] if cursor else []
-        self.shipping_postal_codes_db.close()
-        return truck_types
+        return self.get_rate_catalog().truck_types
 
     def download_excel_template(self):
         """엑셀 템플릿을 다운로드하는 함수"""
@@ -1138,7 +1191,7 @@ class ShippingCalculator:
             ws = wb.active
             ws.title = "Template"
 
-            ws.append(["Postal Code", "Total Trucks", "Truck Type"])  # 엑셀 템플릿의 헤더
+            ws.append(TEMPLATE_HEADERS)  # 엑셀 템플릿의 헤더
 
             wb.save(file_path)
             messagebox.showinfo("Template Downloaded", f"The template was saved at {file_path}.")
@@ -1149,44 +1202,35 @@ class ShippingCalculator:
     def upload_excel_file(self):
         """엑셀 파일을 업로드하여 데이터를 입력하는 함수"""
 
+        upload_queue = queue.Queue()  # 작업 스레드 -> Tk 스레드로 읽은 결과를 전달
+
         def process_file(file_path):
+            # 작업 스레드에서는 파일만 스트리밍으로 읽고 위젯은 건드리지 않음
             try:
-                wb = load_workbook(filename=file_path)
-                ws = wb.active
-
-                # 템플릿 구조를 검증
-                headers = [cell.value for cell in ws[1]]
-                expected_headers = ["Postal Code", "Total Trucks", "Truck Type"]
-                if headers != expected_headers:
-                    messagebox.showerror("Error", "The selected file does not match the expected template format.")
-                    return
-
-                # 기존 입력 필드를 제거
-                while self.destination_entries:
-                    self.remove_input_fields()
-
-                # 엑셀 데이터에 따라 새로운 입력 필드를 추가
-                for row in ws.iter_rows(min_row=2, values_only=True):
-                    postal_code, total_trucks, truck_type = row
-
-                    if not all([postal_code, total_trucks, truck_type]):
-                        continue  # 비어 있는 데이터는 건너뜀
+                upload_queue.put(("done", read_demands(file_path)))
+            except PlanningError as e:
+                upload_queue.put(("error", (e.title, str(e))))
+            except Exception as e:
+                upload_queue.put(("error", ("Error", f"An unexpected error occurred while processing the file: {str(e)}")))
 
-                    self.add_input_fields()
+        def poll_upload():
+            try:
+                status, payload = upload_queue.get_nowait()
+            except queue.Empty:
+                self.root.after(50, poll_upload)
+                return
 
-                    self.destination_entries[-1][1].insert(0, str(postal_code))
-                    self.truck_entries[-1][1].insert(0, str(total_trucks))
-                    self.truck_type_vars[-1].set(truck_type)
+            # 로딩 상태 종료
+            self.stop_loading_animation()
 
-            except Exception as e:
-                messagebox.showerror("Error", f"An unexpected error occurred while processing the file: {str(e)}")
-            finally:
-                # 로딩 상태 종료
-                self.stop_loading_animation()
+            if status == "error":
+                messagebox.showerror(*payload)
+            else:
+                self.fill_input_fields(payload)
 
         # 파일 선택 다이얼로그 열기
         file_path = filedialog.askopenfilename(
-            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")],
+            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("All files", "*.*")],
             title="Select Excel File"
         )
 
@@ -1198,7 +1242,22 @@ class ShippingCalculator:
         self.start_loading_animation()
 
         # 엑셀 파일 처리를 별도의 스레드에서 실행하여 UI가 멈추지 않도록 처리
-        threading.Thread(target=process_file, args=(file_path,)).start()
+        threading.Thread(target=process_file, args=(file_path,), daemon=True).start()
+        self.root.after(50, poll_upload)
+
+    def fill_input_fields(self, demands):
+        """수요 목록으로 입력 필드를 한 번에 다시 만드는 함수 (Tk 스레드에서 호출)"""
+        # 기존 입력 필드를 제거
+        while self.destination_entries:
+            self.remove_input_fields()
+
+        # 엑셀 데이터에 따라 새로운 입력 필드를 추가
+        for demand in demands:
+            self.add_input_fields()
+
+            self.destination_entries[-1][1].insert(0, str(demand['postal_code']))
+            self.truck_entries[-1][1].insert(0, str(demand['trucks']))
+            self.truck_type_vars[-1].set(demand['truck_type'])
 
     def start_loading_animation(self):
         """로딩 중임을 나타내는 애니메이션 시작"""
@@ -1295,13 +1354,29 @@ class ShippingCalculator:
         def save_new_entry():
             carrier = carrier_entry.get()
             truck_type = truck_type_entry.get()
-            total_trucks = int(trucks_entry.get())
+            try:
+                total_trucks = int(trucks_entry.get())
+            except ValueError:
+                messagebox.showerror("Input Error", "Please enter a whole number of trucks.")
+                return
             self.available_trucks_db.connect()
-            self.available_trucks_db.execute_query(
-                'INSERT INTO available_trucks (carrier, truck_type, total_trucks) VALUES (?, ?, ?)',
+            cursor = self.available_trucks_db.execute_query(
+                'SELECT total_trucks FROM available_trucks WHERE carrier = ? AND truck_type = ?',
+                (carrier, truck_type)
+            )
+            existing = cursor.fetchone() if cursor else None
+            # (carrier, truck_type)은 고유 키이므로 이미 있으면 트럭 수를 더함 (중복 행을 합칠 때와 같은 방식)
+            cursor = self.available_trucks_db.execute_query(
+                'INSERT INTO available_trucks (carrier, truck_type, total_trucks) VALUES (?, ?, ?) '
+                'ON CONFLICT (carrier, truck_type) DO UPDATE SET total_trucks = total_trucks + excluded.total_trucks',
                 (carrier, truck_type, total_trucks)
             )
             self.available_trucks_db.close()
+            if cursor is None:
+                return  # 오류는 이미 표시됨 - 창을 닫지 않고 다시 저장할 수 있게 함
+            if existing:
+                messagebox.showinfo("Existing Entry", f"{carrier} ({truck_type}) already existed; "
+                                                      f"{total_trucks} truck(s) were added to its total.")
             self.view_data()
             new_window.destroy()
 
@@ -1378,29 +1453,18 @@ class ShippingCalculator:
 
     def fetch_postal_codes(self):
         """데이터베이스에서 사용 가능한 postal code 목록을 가져오는 함수"""
-        self.shipping_postal_codes_db.connect()
-        cursor = self.shipping_postal_codes_db.execute_query(
-            'SELECT DISTINCT start_postal_code FROM shipping_postal_codes UNION SELECT DISTINCT end_postal_code FROM shipping_postal_codes'
-        )
-        postal_codes = sorted(list(set([str(row[0]) for row in cursor.fetchall()]))) if cursor else []
-        self.shipping_postal_codes_db.close()
-        return postal_codes
+        return self.get_rate_catalog().postal_codes
 
     def update_postal_code_suggestions(self, event, entry):
-        """입력된 텍스트에 따라 postal code 제안을 업데이트하는 함수"""
-        if not hasattr(self, '_postal_codes_cache'):
-            self._postal_codes_cache = self.fetch_postal_codes()
-        
-        current_text = entry.get().strip()
-        if current_text:
-            suggestions = [code for code in self._postal_codes_cache if str(code).startswith(current_text)]
-            entry['values'] = suggestions
-        else:
-            entry['values'] = self._postal_codes_cache
+        """입력된 텍스트에 따라 postal code 제안을 업데이트하는 함수 (정렬된 목록에서 접두어 범위만 잘라냄)"""
+        entry['values'] = self.get_rate_catalog().suggest(entry.get().strip())
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 실행 파일로 묶은 경우 풀이 프로세스 시작용
     root = ttk.Window(themename="superhero")
     app = ShippingCalculator(root)
     root.mainloop()
+    app.engine.shutdown()
+    tms_engine.close_all_connections()
 
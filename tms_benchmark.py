@@ -0,0 +1,353 @@
+"""운임 조회 -> 모델 구성 -> 풀이 경로의 단계별 시간과 최대 메모리를 측정하는 벤치마크
+
+번들된 data_needed의 DB를 임시 폴더에 복사한 뒤 (원본은 수정하지 않음), 고정된 seed로
+10/100/1k/10k 줄의 가상 수요를 만들어 각 단계를 따로 측정합니다.
+가상 수요가 가용 트럭 수 때문에 풀리지 않는 일이 없도록 복사본의 available_trucks는 넉넉하게 채웁니다.
+
+사용 예:
+    python tms_benchmark.py --save-baseline benchmark_baseline.json
+    python tms_benchmark.py --baseline benchmark_baseline.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import scipy
+
+from tms_engine import PlanningError, ShippingEngine, close_all_connections
+
+BUNDLED_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_needed")
+DATABASE_FILES = ["excluded_carriers.db", "available_trucks.db", "shipping_postal_codes.db", "Carrier_assignment.db"]
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+BENCHMARK_TRUCKS = 1000000  # 복사본의 (carrier, truck_type)별 가용 트럭 수
+STAGES = ["exclusions", "rate_fetch_sql", "rate_index", "rate_lookup", "model_build", "carrier_limits", "optimize", "solve", "render"]
+
+
+def prepare_data_dir(source_dir, target_dir):
+    """DB 파일을 벤치마크용 임시 폴더에 복사하고 모든 운송사/트럭 타입의 가용 트럭 수를 넉넉하게 설정하는 함수"""
+    for name in DATABASE_FILES:
+        source = os.path.join(source_dir, name)
+        if os.path.exists(source):
+            shutil.copy(source, os.path.join(target_dir, name))
+
+    conn = sqlite3.connect(os.path.join(target_dir, "available_trucks.db"))
+    try:
+        conn.execute("ATTACH DATABASE ? AS rates", (os.path.join(target_dir, "shipping_postal_codes.db"),))
+        conn.execute("CREATE TABLE IF NOT EXISTS available_trucks (carrier TEXT, truck_type TEXT, total_trucks INTEGER)")
+        conn.execute("DELETE FROM available_trucks")
+        conn.execute("INSERT INTO available_trucks (carrier, truck_type, total_trucks) "
+                     "SELECT DISTINCT carrier, vehicle_type, ? FROM rates.shipping_postal_codes "
+                     "WHERE carrier IS NOT NULL AND vehicle_type IS NOT NULL", (BENCHMARK_TRUCKS,))
+        conn.commit()
+        conn.execute("DETACH DATABASE rates")
+    finally:
+        conn.close()
+
+    # 벤치마크 결과에 이전 배차 이력과 제외 운송사가 영향을 주지 않도록 비움
+    for name, table in (("Carrier_assignment.db", "Carrier_assignment"), ("excluded_carriers.db", "excluded_carriers")):
+        path = os.path.join(target_dir, name)
+        if os.path.exists(path):
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute(f"DELETE FROM {table}")
+                conn.commit()
+            finally:
+                conn.close()
+
+    # GUI/CLI와 같은 인덱스와 트리거로 측정하도록 시작 시 마이그레이션과 (로컬 사본과 같은) 운임 인덱스를 적용
+    engine = ShippingEngine(target_dir)
+    engine.init_db()
+    engine.migrate_rate_database()
+    engine.shutdown()
+
+
+def generate_demands(rate_index, size, seed):
+    """운임이 있는 우편번호 구간에서 size 줄의 가상 수요를 만드는 함수 (같은 seed면 같은 수요)"""
+    rng = random.Random(seed + size)
+
+    # (트럭 타입, 우편번호 구간 시작, 끝) - 운임 행이 하나 이상 있는 구간만 사용
+    segments = []
+    for vehicle_type, boundaries in sorted(rate_index.boundaries.items(), key=lambda item: str(item[0])):
+        for k, rows in enumerate(rate_index.segments[vehicle_type][:-1]):
+            if rows:
+                segments.append((vehicle_type, boundaries[k], boundaries[k + 1] - 1))
+
+    demands = []
+    for _ in range(size):
+        vehicle_type, start, end = rng.choice(segments)
+        demands.append({'postal_code': rng.randint(start, end), 'trucks': rng.randint(1, 3),
+                        'truck_type': vehicle_type})
+    return demands
+
+
+def load_gui_module():
+    """결과 표시 단계 측정을 위해 GUI 모듈(TMS_#3.py)을 불러오는 함수"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "TMS_#3.py")
+    spec = importlib.util.spec_from_file_location("tms_gui", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ResultRenderer:
+    """화면에 보이지 않는 Tk 창에서 ShippingCalculator.display_results를 실행하여 결과 표시 시간을 재는 클래스"""
+
+    def __init__(self):
+        gui = load_gui_module()
+        self.root = gui.ttk.Window()
+        self.root.withdraw()
+
+        # 결과 표시에 필요한 속성만 가진 ShippingCalculator (시작 화면과 DB 연결은 만들지 않음)
+        app = gui.ShippingCalculator.__new__(gui.ShippingCalculator)
+        app.root = self.root
+        app.all_results = None
+        app.main_frame = gui.ttk.Frame(self.root)
+        app.result_frame = gui.ttk.Frame(app.main_frame)
+        app.result_tree = None
+        app.result_render_job = None
+        app.result_group_rows = {}
+        app.result_saved = False
+        self.app = app
+
+    def render(self, result):
+        """결과를 표시하고 나눠서 추가하는 행까지 모두 그려질 때까지 기다리는 함수"""
+        self.app.display_results(result)
+        while self.app.result_render_job is not None:
+            self.root.update()
+        self.root.update_idletasks()
+
+    def close(self):
+        self.root.destroy()
+
+
+def run_stages(data_dir, demands, integer_mode, renderer=None):
+    """한 번의 계획을 단계별로 실행하고 {단계: 걸린 시간(초)}과 계획 크기를 돌려주는 함수
+
+    매번 새 엔진을 만들므로 운임 인덱스 로드 시간도 포함됩니다.
+    """
+    timings = {}
+
+    def timed(stage, func, *args):
+        started = time.perf_counter()
+        value = func(*args)
+        timings[stage] = time.perf_counter() - started
+        return value
+
+    engine = ShippingEngine(data_dir)
+    engine.integer_mode = integer_mode
+
+    input_destination = engine.combine_routes(demands)
+    route_ids = [(entry['postal_code'], entry['truck_type']) for entry in input_destination]
+    truck_requirements = [entry['trucks'] for entry in input_destination]
+
+    engine.excluded_carriers.update(timed("exclusions", engine.get_excluded_carriers))
+    # 운임 인덱스 없이 한 번의 조인 쿼리로 가져오는 경로 (인덱스를 로드하기 전에 측정)
+    timed("rate_fetch_sql", engine.fetch_shipping_rates_sql, route_ids)
+    rate_index = timed("rate_index", engine.get_rate_index)
+    timed("rate_lookup", engine.fetch_shipping_rates_batch, route_ids)
+    model = timed("model_build", engine.build_shipping_model, rate_index, route_ids)
+    timed("carrier_limits", engine.fetch_carrier_limits, model.unique_carriers, model.unique_truck_types)
+    # optimize는 제외 운송사 반영, 가용 트럭 조회, 풀이를 포함한 optimize_shipping 전체 시간
+    result = timed("optimize", engine.optimize_shipping, model, truck_requirements)
+    timings["solve"] = result['solve_time']
+
+    if renderer is not None:
+        timed("render", renderer.render, result)
+
+    engine.shutdown()
+    plan_size = {'routes': len(route_ids), 'columns': model.num_data, 'solver': result['solver'],
+                 'total_cost': result['total_cost']}
+    return timings, plan_size
+
+
+def measure_peak_memory(data_dir, demands, integer_mode):
+    """tracemalloc으로 단계별 최대 메모리(KB)를 측정하는 함수 (시간 측정과는 따로 한 번 실행)"""
+    peaks = {'total': 0}
+    engine = ShippingEngine(data_dir)
+    engine.integer_mode = integer_mode
+
+    input_destination = engine.combine_routes(demands)
+    route_ids = [(entry['postal_code'], entry['truck_type']) for entry in input_destination]
+    truck_requirements = [entry['trucks'] for entry in input_destination]
+
+    def traced(stage, func, *args):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        value = func(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        peaks[stage] = (peak - baseline) / 1024
+        peaks['total'] = max(peaks['total'], peak / 1024)  # 측정 시작부터의 최대 메모리
+        return value
+
+    tracemalloc.start()
+    try:
+        engine.excluded_carriers.update(traced("exclusions", engine.get_excluded_carriers))
+        rate_index = traced("rate_index", engine.get_rate_index)
+        traced("rate_lookup", engine.fetch_shipping_rates_batch, route_ids)
+        model = traced("model_build", engine.build_shipping_model, rate_index, route_ids)
+        traced("carrier_limits", engine.fetch_carrier_limits, model.unique_carriers, model.unique_truck_types)
+        traced("optimize", engine.optimize_shipping, model, truck_requirements)
+    finally:
+        tracemalloc.stop()
+        engine.shutdown()
+    return peaks
+
+
+def run_benchmark(args):
+    """크기별로 단계 시간(repeat회 중 중앙값)과 최대 메모리를 측정하여 결과 사전을 돌려주는 함수"""
+    work_dir = tempfile.mkdtemp(prefix="tms_benchmark_")
+    renderer = None
+    try:
+        prepare_data_dir(args.data_dir, work_dir)
+        rate_index = ShippingEngine(work_dir).get_rate_index()
+
+        if args.render:
+            try:
+                renderer = ResultRenderer()
+            except Exception as e:  # 화면(DISPLAY)이 없는 환경
+                print(f"Render stage skipped: {e}", file=sys.stderr)
+
+        results = {}
+        for size in args.sizes:
+            demands = generate_demands(rate_index, size, args.seed)
+
+            runs = []
+            plan_size = None
+            for _ in range(args.repeat):
+                timings, plan_size = run_stages(work_dir, demands, not args.lp, renderer)
+                runs.append(timings)
+                close_all_connections()
+
+            stages = {stage: {'time': statistics.median(run[stage] for run in runs)}
+                      for stage in STAGES if stage in runs[0]}
+            if not args.no_memory:
+                for stage, peak in measure_peak_memory(work_dir, demands, not args.lp).items():
+                    stages.setdefault(stage, {})['peak_kb'] = peak
+                close_all_connections()
+
+            results[str(size)] = {'plan': plan_size, 'stages': stages}
+            print_size_report(size, plan_size, stages)
+
+        return {
+            'meta': {
+                'date': datetime.now().isoformat(timespec="seconds"),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'scipy': scipy.__version__,
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'repeat': args.repeat,
+                'solver': 'lp' if args.lp else 'milp'
+            },
+            'results': results
+        }
+    finally:
+        if renderer is not None:
+            renderer.close()
+        close_all_connections()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def print_size_report(size, plan_size, stages):
+    """한 크기의 측정 결과를 표로 출력하는 함수"""
+    print(f"\n{size} demand lines -> {plan_size['routes']} routes, {plan_size['columns']} candidate rates "
+          f"({plan_size['solver'].upper()}, total cost {plan_size['total_cost']:,.2f})")
+    print(f"  {'stage':<16}{'time (ms)':>12}{'peak (KB)':>14}")
+    for stage, values in stages.items():
+        time_text = f"{values['time'] * 1000:.1f}" if 'time' in values else "-"
+        peak_text = f"{values['peak_kb']:,.0f}" if 'peak_kb' in values else "-"
+        print(f"  {stage:<16}{time_text:>12}{peak_text:>14}")
+
+
+def compare_with_baseline(report, baseline, threshold, min_time):
+    """기준 결과와 비교하여 threshold배 넘게 느려졌거나 메모리가 늘어난 단계 목록을 돌려주는 함수
+
+    min_time(초)보다 짧은 단계는 측정 오차가 크므로 시간 비교에서 제외합니다.
+    """
+    regressions = []
+    print(f"\nComparison with baseline from {baseline['meta'].get('date', '?')} (threshold x{threshold:g}):")
+    for size, current in report['results'].items():
+        previous = baseline['results'].get(size)
+        if previous is None:
+            print(f"  {size}: no baseline")
+            continue
+
+        for stage, values in current['stages'].items():
+            old_values = previous['stages'].get(stage, {})
+            for key, unit in (('time', 's'), ('peak_kb', 'KB')):
+                if key not in values or not old_values.get(key):
+                    continue
+                if key == 'time' and max(values[key], old_values[key]) < min_time:
+                    continue
+
+                ratio = values[key] / old_values[key]
+                marker = ""
+                if ratio > threshold:
+                    marker = "  <-- REGRESSION"
+                    regressions.append((size, stage, key, ratio))
+                print(f"  {size:>6} {stage:<16}{key:<8} {old_values[key]:>12.4g} -> {values[key]:<12.4g} {unit:<3}"
+                      f"x{ratio:.2f}{marker}")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the rate lookup, model build and solve stages.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Numbers of synthetic demand lines (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Timing runs per size; the median is reported (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic demands")
+    parser.add_argument("--data-dir", default=BUNDLED_DATA_DIR,
+                        help="Directory with the TMS databases to copy (default: bundled data_needed)")
+    parser.add_argument("--lp", action="store_true", help="Benchmark the continuous LP instead of the MILP")
+    parser.add_argument("--render", action="store_true",
+                        help="Also time display_results in a hidden window (needs a display)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak memory pass")
+    parser.add_argument("--save-baseline", metavar="FILE", help="Write the results to FILE as the new baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare the results against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="Slowdown/memory ratio reported as a regression (default: %(default)s)")
+    parser.add_argument("--min-time", type=float, default=0.005,
+                        help="Ignore timing changes of stages faster than this many seconds (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        report = run_benchmark(args)
+    except PlanningError as e:
+        print(f"{e.title}: {e}", file=sys.stderr)
+        return 1
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved at {args.save_baseline}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare_with_baseline(report, baseline, args.threshold, args.min_time):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
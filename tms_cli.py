@@ -0,0 +1,146 @@
+"""엑셀/CSV 수요 파일을 GUI 없이 최적화하는 배치 실행기
+
+사용 예:
+    python tms_cli.py demand.xlsx -o shipping_results.xlsx
+    python tms_cli.py week.xlsx --horizon --commit
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from tms_engine import (DATABASE_PATH, RATE_CACHE_DIR, RESULT_CACHE_DIR, MIP_TIME_LIMIT, MIP_REL_GAP,
+                        PERFORMANCE_LOG_PATH, PlanningError, ShippingEngine, describe_solve)
+from tms_excel import read_demands, read_horizon_demands, write_horizon_workbook, write_results_workbook
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Plan carrier assignments from an Excel/CSV demand file.")
+    parser.add_argument("input_file", nargs="?", help="Template file (.xlsx or .csv) with Postal Code, Total Trucks, Truck Type")
+    parser.add_argument("-o", "--output",
+                        default=f"shipping_results_{datetime.now().strftime('%y-%m-%d %H')}.xlsx",
+                        help="Result workbook path (same format as 'Export Results to Excel')")
+    parser.add_argument("--data-dir", default=DATABASE_PATH,
+                        help="Directory containing the TMS SQLite databases")
+    parser.add_argument("--cache-dir", default=None,
+                        help=f"Read shipping rates from a local copy kept in this directory "
+                             f"(e.g. {RATE_CACHE_DIR}); it is refreshed only when the master file changes")
+    parser.add_argument("--result-cache", nargs="?", const=RESULT_CACHE_DIR, default=None, metavar="DIR",
+                        help=f"Keep plan results on disk and reuse them for identical inputs, exclusions and "
+                             f"availability (default folder: {RESULT_CACHE_DIR})")
+    parser.add_argument("--index-rates", action="store_true",
+                        help="Build the rate lookup indexes in the master shipping_postal_codes.db and exit "
+                             "(admin task; local rate copies made with --cache-dir are always indexed)")
+    parser.add_argument("--wal", action="store_true",
+                        help="Use SQLite WAL journaling for the databases; only for a data directory on a local disk "
+                             "that no other computer opens (the setting is stored in the files)")
+    parser.add_argument("--lp", action="store_true",
+                        help="Solve the continuous LP only instead of integer dispatch (MILP)")
+    parser.add_argument("--time-limit", type=float, default=MIP_TIME_LIMIT,
+                        help="MILP time limit in seconds (default: %(default)s)")
+    parser.add_argument("--mip-gap", type=float, default=MIP_REL_GAP,
+                        help="MILP relative optimality gap (default: %(default)s)")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Split large plans into independent subproblems (per truck type) and solve them "
+                             "on all CPU cores")
+    parser.add_argument("--perf-log", nargs="?", const=PERFORMANCE_LOG_PATH, default=None, metavar="FILE",
+                        help=f"Append per-stage timings, DB calls and solver stats as a JSON line "
+                             f"(default file: {PERFORMANCE_LOG_PATH})")
+    parser.add_argument("--horizon", action="store_true",
+                        help="Plan several dates at once; the input file needs a leading Date column (YYYY-MM-DD) "
+                             "and every date gets the full available_trucks capacity")
+    parser.add_argument("--commit", action="store_true",
+                        help="With --horizon: commit the first date; the later dates are tentative and are planned "
+                             "again by the next run")
+    parser.add_argument("--run-id", default=None,
+                        help="With --commit: tag the committed rows with this ID; running again with the same ID "
+                             "replaces the earlier commit (default: derived from the demand file's contents)")
+    return parser
+
+
+def run_horizon(engine, args):
+    """--horizon 실행: (date, 결과) 목록과 풀이 요약 목록을 돌려주는 함수"""
+    demands = read_horizon_demands(args.input_file)
+    if args.commit:
+        horizon = engine.roll_horizon(demands, run_id=args.run_id)
+        print(describe_solve(horizon))
+        print(f"{horizon['committed']} committed ({horizon['run_id']}); "
+              f"{len(horizon['dates']) - 1} later date(s) are tentative.")
+    else:
+        horizon = engine.plan_horizon(demands)
+        print(describe_solve(horizon))
+    return list(zip(horizon['dates'], horizon['days']))
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.input_file and not args.index_rates:
+        parser.error("the input_file argument is required")
+    if args.commit and not args.horizon:
+        print("Error: --commit requires --horizon", file=sys.stderr)
+        return 1
+    engine = None
+
+    try:
+        engine = ShippingEngine(args.data_dir, cache_dir=args.cache_dir, result_cache_dir=args.result_cache,
+                                wal=args.wal)
+        engine.integer_mode = not args.lp
+        engine.mip_time_limit = args.time_limit
+        engine.mip_gap = args.mip_gap
+        engine.decompose = args.parallel
+        engine.init_db()
+        if args.index_rates:
+            applied = engine.migrate_rate_database()
+            print(f"Rate database indexes are up to date ({applied} migration step(s) applied).")
+            return 0
+        if args.horizon:
+            day_results = run_horizon(engine, args)
+        else:
+            demands = read_demands(args.input_file)
+            result = engine.plan(demands)
+    except PlanningError as e:
+        print(f"{e.title}: {e}", file=sys.stderr)
+        return 1
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if engine is not None:
+            engine.shutdown()
+            if args.perf_log and engine.last_metrics is not None:
+                try:
+                    engine.last_metrics.write_log(args.perf_log)
+                except OSError as e:
+                    # 기록 실패는 경고만 표시하고 계획 결과 저장은 계속함
+                    print(f"Warning: failed to write the performance log {args.perf_log}: {e}", file=sys.stderr)
+
+    if args.horizon:
+        for plan_date, day_result in day_results:
+            for destination, truck_type in day_result['missing_routes']:
+                print(f"No data found for the postal code {destination} and truck type {truck_type} on {plan_date}.",
+                      file=sys.stderr)
+    else:
+        for destination, truck_type in result['missing_routes']:
+            print(f"No data found for the postal code {destination} and truck type {truck_type}.", file=sys.stderr)
+
+    try:
+        if args.horizon:
+            total_cost = write_horizon_workbook(day_results, args.output)
+        else:
+            total_cost = write_results_workbook(result, args.output)
+    except PermissionError:
+        print(f"Failed to save the file at {args.output}. Please check if the file is open "
+              f"or you have the necessary permissions.", file=sys.stderr)
+        return 1
+
+    if args.horizon:
+        print(f"{len(day_results)} dates planned. Total cost: ${total_cost:,.2f} (MXN)")
+    else:
+        print(f"{len(demands)} routes planned. Total cost: ${total_cost:,.2f} (MXN)")
+        print(describe_solve(result))
+    print(f"The results were saved at {args.output}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1881 @@
+import os
+import glob
+import json
+import pickle
+import hashlib
+import time
+import sqlite3
+import bisect
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime
+from scipy.optimize import linprog, milp, LinearConstraint, Bounds
+from scipy.sparse import block_diag, bmat, coo_matrix, vstack
+from scipy.sparse.csgraph import connected_components
+import numpy as np
+
+DATABASE_PATH = "//10.193.232.18/Java/우현 테스트/data_needed"
+EXCLUDED_CARRIERS_DB = f"{DATABASE_PATH}/excluded_carriers.db"
+AVAILABLE_TRUCKS_DB = f"{DATABASE_PATH}/available_trucks.db"
+SHIPPING_POSTAL_CODES_DB = f"{DATABASE_PATH}/shipping_postal_codes.db"
+CARRIER_ASSIGNMENT_DB = f"{DATABASE_PATH}/Carrier_assignment.db"
+RATE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "tms_cache")  # 운임 DB 로컬 사본 폴더
+MIP_TIME_LIMIT = 30.0  # 정수 최적화 시간 제한 (초)
+MIP_REL_GAP = 1e-4  # 정수 최적화 허용 상대 갭
+PLAN_STAGES = ("Rate lookup", "Model build", "Solve")  # plan()이 progress 콜백으로 알리는 단계
+PERFORMANCE_LOG_PATH = os.path.join(tempfile.gettempdir(), "tms_logs", "performance.jsonl")  # 계산별 성능 기록
+PROCESS_SOLVE_MIN_COLUMNS = 2000  # 취소 가능한 계산에서 후보 운임이 이 수 이상이면 별도 프로세스에서 풀이
+NARROW_RATE_RANGE = 1000  # 폭이 이 값 이하인 운임 우편번호 구간은 시작 우편번호 범위로 인덱스 검색
+RESULT_CACHE_SIZE = 32  # 메모리에 보관하는 계획 결과 수
+RESULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "tms_cache", "results")  # 계획 결과 디스크 캐시 폴더
+
+
+class PlanningError(Exception):
+    """배차 계획 중 발생한 오류 (GUI에서는 title을 메시지 박스 제목으로 사용)"""
+    title = "Error"
+
+
+class InputError(PlanningError):
+    title = "Input Error"
+
+
+class DatabaseError(PlanningError):
+    title = "Database Error"
+
+
+class OptimizationError(PlanningError):
+    title = "Optimization Error"
+
+
+class PlanningCancelled(PlanningError):
+    title = "Cancelled"
+
+
+_pool = threading.local()  # 스레드별 연결 풀: db_path -> sqlite3.Connection
+_pool_lock = threading.Lock()
+_pooled_connections = []  # (스레드, db_path, 연결) 목록 - 종료된 스레드의 연결 정리용
+
+
+def _count_statement(sql):
+    """연결의 trace 콜백 - 현재 스레드에서 실행한 SQL 문 수를 셈 (PlanMetrics의 쿼리 수 집계용)"""
+    _pool.statements = getattr(_pool, "statements", 0) + 1
+
+
+def statement_count():
+    """현재 스레드에서 지금까지 실행한 SQL 문 수"""
+    return getattr(_pool, "statements", 0)
+
+
+def _release_dead_connections():
+    """종료된 스레드가 사용하던 연결을 닫는 함수"""
+    with _pool_lock:
+        alive = []
+        for thread, db_path, conn in _pooled_connections:
+            if thread.is_alive():
+                alive.append((thread, db_path, conn))
+            else:
+                conn.close()
+        _pooled_connections[:] = alive
+
+
+def close_all_connections():
+    """풀에 남아 있는 모든 연결을 닫는 함수 (프로그램 종료 시 호출)"""
+    with _pool_lock:
+        for _, _, conn in _pooled_connections:
+            conn.close()
+        _pooled_connections.clear()
+    _pool.__dict__.clear()
+
+
+class DatabaseManager:
+    """스레드마다 db_path별로 하나의 연결을 계속 재사용하는 데이터베이스 관리자
+
+    connect()/close()는 매번 파일을 열고 닫지 않고 풀의 연결을 빌려주고 돌려받기만 합니다.
+    여러 문장을 한 번에 커밋하려면 transaction()을 사용합니다.
+    """
+
+    def __init__(self, db_path, wal=False):
+        self.db_path = db_path
+        self.wal = wal  # WAL 저널 사용 여부 (로컬 디스크에서 이 프로그램만 쓰는 파일에만 사용)
+
+    @property
+    def conn(self):
+        return getattr(_pool, "connections", {}).get(self.db_path)
+
+    def _transaction_depth(self):
+        return getattr(_pool, "depths", {}).get(self.db_path, 0)
+
+    def connect(self):
+        connections = _pool.__dict__.setdefault("connections", {})
+        conn = connections.get(self.db_path)
+        if conn is None:
+            _release_dead_connections()
+            # 종료된 스레드의 연결을 다른 스레드에서 닫을 수 있도록 check_same_thread를 끔
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.configure_connection(conn)
+            connections[self.db_path] = conn
+            with _pool_lock:
+                _pooled_connections.append((threading.current_thread(), self.db_path, conn))
+        return conn
+
+    def configure_connection(self, conn):
+        """새 연결에 캐시/저널 관련 PRAGMA를 설정하는 함수"""
+        conn.set_trace_callback(_count_statement)
+        conn.execute("PRAGMA cache_size = -8000")  # 8MB 페이지 캐시
+        conn.execute("PRAGMA temp_store = MEMORY")
+        # WAL은 파일에 저장되고 공유 메모리를 사용하므로 네트워크 공유 폴더(SMB, 매핑된 드라이브)의 파일에는
+        # 사용할 수 없음 - 로컬 운임 사본이나 명시적으로 지정한 경우에만 사용
+        try:
+            if self.wal:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+            elif conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                # 이전 버전이 WAL로 바꿔 둔 공유 파일은 기본 저널로 되돌림 (다른 연결이 열려 있으면 다음에 다시 시도)
+                conn.execute("PRAGMA journal_mode = DELETE")
+        except sqlite3.Error:
+            pass  # 읽기 전용이거나 사용 중인 파일은 현재 저널 모드를 유지
+
+    def discard(self):
+        """현재 스레드에서 이 DB 파일에 열려 있는 연결을 완전히 닫는 함수"""
+        conn = getattr(_pool, "connections", {}).pop(self.db_path, None)
+        if conn is None:
+            return
+        with _pool_lock:
+            _pooled_connections[:] = [entry for entry in _pooled_connections if entry[2] is not conn]
+        conn.close()
+
+    def close(self):
+        """연결을 풀에 돌려주는 함수 (트랜잭션 밖에서 커밋되지 않은 변경은 기존처럼 버림)"""
+        conn = self.conn
+        if conn is not None and conn.in_transaction and self._transaction_depth() == 0:
+            conn.rollback()
+
+    @contextmanager
+    def transaction(self):
+        """블록 안의 모든 쿼리를 하나의 트랜잭션으로 묶고, 예외가 나면 전부 롤백하는 함수"""
+        conn = self.connect()
+        depths = _pool.__dict__.setdefault("depths", {})
+        depth = depths.get(self.db_path, 0)
+        if depth == 0:
+            conn.execute("BEGIN IMMEDIATE")
+        depths[self.db_path] = depth + 1
+        try:
+            yield conn
+        except Exception:
+            if depth == 0:
+                conn.rollback()
+            raise
+        else:
+            if depth == 0:
+                conn.commit()
+        finally:
+            depths[self.db_path] = depth
+
+    def execute_query(self, query, params=()):
+        cursor = self.conn.cursor()
+        cursor.execute(query, params)
+        # transaction() 블록 안에서는 블록이 끝날 때 한 번만 커밋
+        if self._transaction_depth() == 0 and self.conn.in_transaction:
+            self.conn.commit()
+        return cursor
+
+
+def migrate(db_manager, migrations):
+    """PRAGMA user_version을 스키마 버전으로 사용하여 아직 적용하지 않은 마이그레이션만 순서대로 적용하는 함수
+
+    migrations[i]는 연결을 받아 버전 i + 1로 올리는 함수이며, 각 단계는 하나의 트랜잭션으로 처리됩니다.
+    새로 적용한 단계가 있으면 ANALYZE로 쿼리 플래너 통계를 갱신합니다. 적용한 단계 수를 돌려줍니다.
+    """
+    conn = db_manager.connect()
+    try:
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= len(migrations):
+            return 0  # 이미 최신 버전 (쓰기 잠금 없이 확인)
+
+        applied = 0
+        for version, step in enumerate(migrations, start=1):
+            with db_manager.transaction():
+                # 여러 PC에서 동시에 시작한 경우를 위해 잠금을 잡은 뒤 버전을 다시 확인
+                if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    continue
+                step(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                applied += 1
+
+        if applied:
+            conn.execute('ANALYZE')
+        return applied
+    finally:
+        db_manager.close()
+
+
+def _create_excluded_carriers(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS excluded_carriers (
+            carrier TEXT,
+            destination_postal_code INTEGER,
+            PRIMARY KEY (carrier, destination_postal_code)
+        )
+    ''')
+
+
+def _create_carrier_assignment(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS Carrier_assignment (
+            postal_code INTEGER,
+            carrier TEXT,
+            type TEXT,
+            assigned_truck INTEGER,
+            Time TEXT
+        )
+    ''')
+    # 예전 버전으로 만든 테이블에는 저장 시 사용하는 Time 열이 없을 수 있음
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(Carrier_assignment)')}
+    if 'Time' not in columns:
+        conn.execute('ALTER TABLE Carrier_assignment ADD COLUMN Time TEXT')
+
+
+def _index_carrier_assignment(conn):
+    # 이력 조회/리셋 (Time), 가용 트럭 계산 (carrier, type), 운송사 배차 취소 (postal_code, carrier)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_carrier_assignment_time ON Carrier_assignment (Time)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_carrier_assignment_carrier_type ON Carrier_assignment (carrier, type)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_carrier_assignment_postal_carrier '
+                 'ON Carrier_assignment (postal_code, carrier)')
+
+
+def _unique_available_trucks(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS available_trucks (
+            carrier TEXT,
+            truck_type TEXT,
+            total_trucks INTEGER
+        )
+    ''')
+    # 같은 (carrier, truck_type)이 여러 행이면 한도 계산(SUM)과 같은 값의 한 행으로 합침
+    conn.execute('''
+        CREATE TEMP TABLE merged_trucks AS
+        SELECT carrier, truck_type, SUM(total_trucks) AS total_trucks FROM available_trucks
+        WHERE carrier IS NOT NULL AND truck_type IS NOT NULL
+        GROUP BY carrier, truck_type HAVING COUNT(*) > 1
+    ''')
+    conn.execute('DELETE FROM available_trucks WHERE (carrier, truck_type) IN '
+                 '(SELECT carrier, truck_type FROM temp.merged_trucks)')
+    conn.execute('INSERT INTO available_trucks (carrier, truck_type, total_trucks) '
+                 'SELECT carrier, truck_type, total_trucks FROM temp.merged_trucks')
+    conn.execute('DROP TABLE temp.merged_trucks')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_available_trucks_carrier_type '
+                 'ON available_trucks (carrier, truck_type)')
+
+
+def _track_version(conn, table):
+    """table이 바뀔 때마다 data_version의 버전을 올리는 트리거를 만드는 함수 (계획 결과 캐시 키에 사용)"""
+    conn.execute('CREATE TABLE IF NOT EXISTS data_version (name TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+    conn.execute('INSERT OR IGNORE INTO data_version (name, version) VALUES (?, 0)', (table,))
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table} '
+                     f"BEGIN UPDATE data_version SET version = version + 1 WHERE name = '{table}'; END")
+
+
+def _version_carrier_assignment(conn):
+    _track_version(conn, "Carrier_assignment")
+
+
+def _version_available_trucks(conn):
+    _track_version(conn, "available_trucks")
+
+
+def _total_assigned_trucks(conn):
+    # (carrier, type)별 배차 트럭 합계를 Carrier_assignment와 같은 트랜잭션에서 트리거로 유지
+    # (엔진 밖에서 직접 지우거나 고친 행도 반영되며, 조회는 이력 크기와 관계없이 조합 수만큼만 읽음)
+    conn.execute('CREATE TABLE IF NOT EXISTS assigned_trucks '
+                 '(carrier TEXT, type TEXT, assigned_truck INTEGER NOT NULL, PRIMARY KEY (carrier, type))')
+    conn.execute('DELETE FROM assigned_trucks')
+    conn.execute('INSERT INTO assigned_trucks (carrier, type, assigned_truck) '
+                 'SELECT carrier, type, SUM(IFNULL(assigned_truck, 0)) FROM Carrier_assignment '
+                 'GROUP BY carrier, type HAVING SUM(IFNULL(assigned_truck, 0)) != 0')
+    add_new = ('INSERT INTO assigned_trucks (carrier, type, assigned_truck) '
+               'VALUES (NEW.carrier, NEW.type, IFNULL(NEW.assigned_truck, 0)) '
+               'ON CONFLICT (carrier, type) DO UPDATE SET assigned_truck = assigned_truck + excluded.assigned_truck;')
+    remove_old = ('UPDATE assigned_trucks SET assigned_truck = assigned_truck - IFNULL(OLD.assigned_truck, 0) '
+                  'WHERE carrier = OLD.carrier AND type = OLD.type; '
+                  'DELETE FROM assigned_trucks WHERE carrier = OLD.carrier AND type = OLD.type '
+                  'AND assigned_truck = 0;')
+    conn.execute('CREATE TRIGGER IF NOT EXISTS Carrier_assignment_insert_total AFTER INSERT ON Carrier_assignment '
+                 f'BEGIN {add_new} END')
+    conn.execute('CREATE TRIGGER IF NOT EXISTS Carrier_assignment_delete_total AFTER DELETE ON Carrier_assignment '
+                 f'BEGIN {remove_old} END')
+    conn.execute('CREATE TRIGGER IF NOT EXISTS Carrier_assignment_update_total '
+                 'AFTER UPDATE OF carrier, type, assigned_truck ON Carrier_assignment '
+                 f'BEGIN {remove_old} {add_new} END')
+
+
+def _run_id_carrier_assignment(conn):
+    # 다일 계획(roll_horizon)이 확정한 행을 Time이 아닌 실행 ID로 되돌리기 위한 열 (수동 저장은 NULL)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(Carrier_assignment)')}
+    if 'run_id' not in columns:
+        conn.execute('ALTER TABLE Carrier_assignment ADD COLUMN run_id TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_carrier_assignment_run_id ON Carrier_assignment (run_id)')
+
+
+def _index_shipping_postal_codes(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_shipping_postal_codes_range '
+                 'ON shipping_postal_codes (vehicle_type, start_postal_code, end_postal_code)')
+
+
+def _index_postal_range_widths(conn):
+    # 단일 우편번호가 아닌 구간만 폭별로 담는 부분 인덱스 (fetch_shipping_rates_sql에서 폭별로 나눠 검색)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_shipping_postal_codes_narrow_range '
+                 'ON shipping_postal_codes (vehicle_type, start_postal_code, end_postal_code) '
+                 f'WHERE end_postal_code > start_postal_code AND end_postal_code - start_postal_code <= {NARROW_RATE_RANGE}')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_shipping_postal_codes_wide_range '
+                 'ON shipping_postal_codes (vehicle_type, start_postal_code, end_postal_code) '
+                 f'WHERE end_postal_code - start_postal_code > {NARROW_RATE_RANGE}')
+
+
+# DB 파일별 스키마 마이그레이션 (순서대로 버전 1, 2, ... - 기존 단계는 수정하지 말고 뒤에 추가)
+EXCLUDED_CARRIERS_MIGRATIONS = [_create_excluded_carriers]
+CARRIER_ASSIGNMENT_MIGRATIONS = [_create_carrier_assignment, _index_carrier_assignment, _version_carrier_assignment,
+                                _total_assigned_trucks, _run_id_carrier_assignment]
+AVAILABLE_TRUCKS_MIGRATIONS = [_unique_available_trucks, _version_available_trucks]
+SHIPPING_POSTAL_CODES_MIGRATIONS = [_index_shipping_postal_codes, _index_postal_range_widths]
+
+
+class LocalDatabaseCache:
+    """네트워크 공유 폴더의 DB 파일을 로컬 사본으로 복사해 두고 원본이 바뀐 경우에만 다시 복사하는 캐시
+
+    원본의 (mtime, size)를 사본 파일 이름에 기록하므로 프로그램을 다시 시작해도 원본이
+    그대로라면 복사 없이 기존 사본을 사용합니다.
+    """
+
+    def __init__(self, master_path, cache_dir=RATE_CACHE_DIR, check_interval=60, migrations=None):
+        self.master_path = master_path
+        self.cache_dir = cache_dir
+        self.migrations = migrations  # 새 사본에만 적용하는 마이그레이션 (인덱스 등 - 원본은 수정하지 않음)
+        self.check_interval = check_interval  # 원본 변경 확인 간격 (초)
+        self.local_path = None
+        self.signature = None
+        self.last_check = None
+
+        name, ext = os.path.splitext(os.path.basename(master_path))
+        self._name = name
+        self._ext = ext
+
+    def master_signature(self):
+        """원본 파일의 변경 여부를 확인하기 위한 (mtime, size) 값"""
+        stat = os.stat(self.master_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def snapshot_path(self, signature):
+        return os.path.join(self.cache_dir, f"{self._name}.{signature[0]}-{signature[1]}{self._ext}")
+
+    def refresh(self):
+        """원본이 바뀌었으면 로컬 사본을 새로 만들고 True를 돌려주는 함수"""
+        now = time.monotonic()
+        if self.local_path is not None and now - self.last_check < self.check_interval:
+            return False
+        self.last_check = now
+
+        try:
+            signature = self.master_signature()
+        except OSError:
+            # 원본에 접근할 수 없으면 가장 최근 사본을 계속 사용
+            if self.local_path is None:
+                snapshots = glob.glob(os.path.join(self.cache_dir, f"{self._name}.*{self._ext}"))
+                if not snapshots:
+                    raise
+                self.local_path = max(snapshots, key=os.path.getmtime)
+                return True
+            return False
+
+        if signature == self.signature:
+            return False
+
+        path = self.snapshot_path(signature)
+        if not os.path.exists(path):
+            self._copy_master(path)
+        self.signature = signature
+        self.local_path = path
+        self._remove_old_snapshots()
+        return True
+
+    def _copy_master(self, path):
+        """SQLite 백업 API로 원본의 일관된 스냅샷을 만든 뒤 사본 이름으로 바꾸는 함수"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 같은 캐시 폴더를 쓰는 다른 프로세스(GUI, 계획 서비스)와 임시 파일이 겹치지 않도록 프로세스별 이름 사용
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            source = sqlite3.connect(self.master_path)
+            target = sqlite3.connect(temp_path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+
+            # 사본 이름으로 바꾸기 전에 적용하므로 다른 프로세스는 항상 인덱스가 있는 사본만 봄
+            if self.migrations:
+                snapshot_db = DatabaseManager(temp_path)
+                try:
+                    migrate(snapshot_db, self.migrations)
+                finally:
+                    snapshot_db.discard()
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _remove_old_snapshots(self):
+        for path in glob.glob(os.path.join(self.cache_dir, f"{self._name}.*{self._ext}")):
+            if path == self.local_path:
+                continue
+            for file_path in (path, f"{path}-wal", f"{path}-shm"):
+                try:
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    break  # 다른 프로그램이 아직 사용 중인 사본은 다음에 정리
+
+
+class ResultCache:
+    """계획 결과를 입력 키로 보관하는 LRU 캐시
+
+    메모리에는 최근 max_entries개만 두고, disk_dir을 주면 결과를 pickle 파일로도 저장하여
+    프로그램을 다시 시작한 뒤에도 사용합니다 (디스크에는 최근 max_disk_entries개만 남김).
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, disk_dir=None, max_disk_entries=256):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()  # 키 -> 결과 (뒤쪽이 최근 사용)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def get(self, key):
+        """키에 해당하는 결과를 돌려주는 함수 (없으면 None)"""
+        with self._lock:
+            result = self.entries.get(key)
+            if result is None and self.disk_dir:
+                try:
+                    os.utime(self.disk_path(key))  # 디스크에서도 최근 사용한 결과가 남도록 표시
+                    with open(self.disk_path(key), "rb") as f:
+                        result = pickle.load(f)
+                except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                    result = None
+            if result is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._remember(key, result)
+            return result
+
+    def put(self, key, result):
+        """결과를 메모리에 (그리고 디스크 캐시를 사용하면 파일로도) 저장하는 함수"""
+        with self._lock:
+            self._remember(key, result)
+            if not self.disk_dir:
+                return
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+                temp_path = f"{self.disk_path(key)}.{os.getpid()}.tmp"
+                with open(temp_path, "wb") as f:
+                    pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temp_path, self.disk_path(key))
+                self._remove_old_files()
+            except (OSError, pickle.PicklingError):
+                pass  # 디스크 캐시는 실패해도 계산 결과에 영향을 주지 않음
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def _remember(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _remove_old_files(self):
+        paths = sorted(glob.glob(os.path.join(self.disk_dir, "*.pkl")), key=os.path.getmtime)
+        for path in paths[:max(len(paths) - self.max_disk_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_EMPTY_SEGMENT = (np.zeros(0, dtype=np.int64), np.zeros(0))  # 운임이 없는 루트의 (운송사 코드, 운임)
+
+
+class RateIndex:
+    """트럭 타입별 우편번호 구간을 정렬해 두고 이진 탐색으로 운임을 조회하는 인덱스"""
+
+    def __init__(self, rows):
+        self.boundaries = {}  # vehicle_type -> 정렬된 구간 경계값 리스트
+        self.segments = {}  # vehicle_type -> 경계값 사이 구간별 운임 행 리스트
+        self.row_count = len(rows)  # 인덱스를 만들 때 읽은 운임 행 수
+
+        rows_by_type = defaultdict(list)
+        for row in rows:
+            # vehicle_type이나 우편번호 범위가 비어 있는 행은 BETWEEN 조건에 걸리지 않으므로 제외
+            if row[1] is None or row[3] is None or row[4] is None:
+                continue
+            rows_by_type[row[1]].append(row)
+
+        for vehicle_type, type_rows in rows_by_type.items():
+            boundaries = sorted({row[3] for row in type_rows} | {row[4] + 1 for row in type_rows})
+            segments = [[] for _ in boundaries]
+            seen = [set() for _ in boundaries]
+
+            for row in type_rows:
+                first = bisect.bisect_left(boundaries, row[3])
+                last = bisect.bisect_left(boundaries, row[4] + 1)
+                for k in range(first, last):
+                    # 중복된 carrier, cost 조합은 먼저 나온 행만 유지 (기존 중복 제거 기준과 동일)
+                    key = (row[0], row[5])
+                    if key not in seen[k]:
+                        seen[k].add(key)
+                        segments[k].append(row)
+
+            self.boundaries[vehicle_type] = boundaries
+            self.segments[vehicle_type] = segments
+
+        # 모델 구성용: 운송사 이름을 정수 코드로 바꾸고 구간별로 (운송사 코드, 운임) 배열을 미리 만들어 둠
+        self.carriers = []  # 운송사 코드 -> 운송사 이름
+        self.carrier_codes = {}  # 운송사 이름 -> 운송사 코드
+        self.segment_arrays = {}  # vehicle_type -> 구간별 (운송사 코드 배열, 운임 배열)
+        for vehicle_type, segments in self.segments.items():
+            self.segment_arrays[vehicle_type] = [
+                (np.array([self.carrier_code(row[0]) for row in rows], dtype=np.int64),
+                 np.array([row[5] for row in rows], dtype=float))
+                for rows in segments
+            ]
+
+    def carrier_code(self, carrier):
+        """운송사 이름의 정수 코드를 돌려주는 함수 (처음 나온 운송사에는 새 코드를 부여)"""
+        code = self.carrier_codes.get(carrier)
+        if code is None:
+            code = self.carrier_codes[carrier] = len(self.carriers)
+            self.carriers.append(carrier)
+        return code
+
+    @classmethod
+    def load(cls, db_manager):
+        """shipping_postal_codes 테이블 전체를 한 번 읽어서 인덱스를 생성하는 함수"""
+        conn = db_manager.connect()
+        try:
+            rows = conn.execute(
+                '''SELECT carrier, vehicle_type, origin, start_postal_code, end_postal_code, cost
+                   FROM shipping_postal_codes ORDER BY rowid'''
+            ).fetchall()
+        finally:
+            db_manager.close()
+        return cls(rows)
+
+    def lookup(self, destination, truck_type):
+        """목적지 우편번호와 트럭 타입에 해당하는 운임 행을 이진 탐색으로 찾는 함수"""
+        boundaries = self.boundaries.get(truck_type)
+        if not boundaries:
+            return []
+        k = bisect.bisect_right(boundaries, destination) - 1
+        if k < 0:
+            return []
+        return self.segments[truck_type][k]
+
+    def lookup_many(self, routes):
+        """(우편번호, 트럭 타입) 목록 전체를 한 번에 조회하는 함수"""
+        return {route: self.lookup(*route) for route in routes}
+
+    def lookup_arrays(self, destination, truck_type):
+        """lookup과 같은 구간의 운임을 (운송사 코드 배열, 운임 배열)로 돌려주는 함수"""
+        boundaries = self.boundaries.get(truck_type)
+        if boundaries:
+            k = bisect.bisect_right(boundaries, destination) - 1
+            if k >= 0:
+                return self.segment_arrays[truck_type][k]
+        return _EMPTY_SEGMENT
+
+
+class RateCatalog:
+    """운임 DB의 우편번호 목록(자동완성용 정렬 인덱스)과 트럭 타입 목록"""
+
+    def __init__(self, postal_codes, truck_types):
+        self.postal_codes = sorted({str(code) for code in postal_codes})  # 문자열 순으로 정렬 (접두어 검색용)
+        self.truck_types = list(truck_types)
+
+    @classmethod
+    def load(cls, db_manager):
+        """우편번호와 트럭 타입 목록을 한 번 읽어서 카탈로그를 생성하는 함수"""
+        conn = db_manager.connect()
+        try:
+            postal_codes = [row[0] for row in conn.execute(
+                'SELECT DISTINCT start_postal_code FROM shipping_postal_codes '
+                'UNION SELECT DISTINCT end_postal_code FROM shipping_postal_codes')]
+            truck_types = [row[0] for row in conn.execute('SELECT DISTINCT vehicle_type FROM shipping_postal_codes')]
+        finally:
+            db_manager.close()
+        return cls(postal_codes, truck_types)
+
+    def suggest(self, prefix):
+        """prefix로 시작하는 우편번호를 이진 탐색으로 찾는 함수 (정렬 순서 유지)"""
+        if not prefix:
+            return self.postal_codes
+        first = bisect.bisect_left(self.postal_codes, prefix)
+        last = bisect.bisect_left(self.postal_codes, prefix + "\U0010ffff", first)
+        return self.postal_codes[first:last]
+
+
+def describe_solve(result):
+    """결과에 기록된 풀이 방식, 풀이 시간, MIP 갭을 한 줄로 요약하는 함수"""
+    text = f"Solver: {result['solver'].upper()} | Solve time: {result['solve_time']:.2f}s"
+    if result['mip_gap'] is not None:
+        text += f" | MIP gap: {result['mip_gap']:.2%}"
+    if result.get('cached'):
+        text += " | Cached result"
+    return text
+
+
+class PlanMetrics:
+    """한 번의 계산에서 단계별 시간, DB 호출(쿼리 수, 행 수, 시간), 풀이 통계를 모으는 클래스"""
+
+    _log_lock = threading.Lock()
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.stages = {}  # 단계 이름 -> 걸린 시간 (초)
+        self.db_calls = []  # {'call', 'db', 'queries', 'rows', 'time'}
+        self.solver = {}  # HiGHS 결과의 상태, 반복 수, 노드 수, MIP 갭 등
+        self.plan = {}  # 루트 수, 후보 운임 수
+        self.error = None
+
+    @contextmanager
+    def stage(self, name):
+        """블록의 실행 시간을 name 단계에 더하는 함수"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    @contextmanager
+    def db_call(self, name, db_manager):
+        """블록 안의 DB 호출 시간과 실행한 SQL 문 수를 기록하는 함수 (읽은 행 수는 호출한 쪽에서 'rows'에 기록)"""
+        call = {'call': name, 'db': os.path.basename(db_manager.db_path), 'queries': 0, 'rows': 0, 'time': 0.0}
+        statements = statement_count()
+        started = time.perf_counter()
+        try:
+            yield call
+        finally:
+            call['time'] = time.perf_counter() - started
+            call['queries'] = statement_count() - statements
+            self.db_calls.append(call)
+
+    @classmethod
+    def from_dict(cls, data):
+        """as_dict()로 만든 사전(계획 서비스의 응답 등)에서 기록을 다시 만드는 함수"""
+        metrics = cls()
+        metrics.started = datetime.fromisoformat(data['time'])
+        metrics.stages = dict(data['stages'])
+        metrics.db_calls = list(data['db_calls'])
+        metrics.solver = dict(data['solver'])
+        metrics.plan = dict(data['plan'])
+        metrics.error = data['error']
+        return metrics
+
+    def as_dict(self):
+        """로그 파일과 Performance 창에서 사용하는 사전 형태로 바꾸는 함수"""
+        return {
+            'time': self.started.isoformat(timespec="seconds"),
+            'stages': dict(self.stages),
+            'db_calls': list(self.db_calls),
+            'db_totals': {
+                'queries': sum(call['queries'] for call in self.db_calls),
+                'rows': sum(call['rows'] for call in self.db_calls),
+                'time': sum(call['time'] for call in self.db_calls)
+            },
+            'solver': dict(self.solver),
+            'plan': dict(self.plan),
+            'error': self.error
+        }
+
+    def write_log(self, path=PERFORMANCE_LOG_PATH):
+        """성능 기록을 JSON 한 줄로 로그 파일에 추가하는 함수"""
+        log_dir = os.path.dirname(path)
+        if log_dir:  # 파일 이름만 주면 현재 폴더에 기록
+            os.makedirs(log_dir, exist_ok=True)
+        line = json.dumps(self.as_dict(), ensure_ascii=False, default=str)
+        with self._log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def _solver_stats(result):
+    """scipy (HiGHS) 결과에서 상태, 반복 수, 노드 수, MIP 갭 등 풀이 통계를 꺼내는 함수"""
+    stats = {'status': int(result.status), 'message': str(result.message)}
+    for key in ('nit', 'mip_node_count'):
+        if result.get(key) is not None:
+            stats[key] = int(result[key])
+    for key in ('fun', 'mip_dual_bound', 'mip_gap'):
+        if result.get(key) is not None:
+            stats[key] = float(result[key])
+    return stats
+
+
+def solve_model(costs, A_eq, b_eq, A_ub, b_ub, upper_bounds, integer_mode=True, time_limit=MIP_TIME_LIMIT,
+                mip_gap=MIP_REL_GAP):
+    """희소 모델을 HiGHS로 풀어 (solver, x, 풀이 통계)를 돌려주는 함수 (별도 프로세스에서도 호출됨)
+
+    integer_mode이면 scipy.optimize.milp로 정수 배차를 먼저 시도하고,
+    시간 제한 안에 정수해를 찾지 못하면 LP 완화 문제의 해를 사용합니다.
+    """
+    if integer_mode:
+        constraints = [LinearConstraint(A_eq, b_eq, b_eq)]
+        if A_ub is not None:
+            constraints.append(LinearConstraint(A_ub, -np.inf, b_ub))
+
+        result = milp(costs, integrality=np.ones(len(costs)), bounds=Bounds(0, upper_bounds),
+                      constraints=constraints, options={'time_limit': time_limit, 'mip_rel_gap': mip_gap})
+        if result.x is not None:
+            # MILP 해는 허용 오차 안의 실수(예: 2.9999999)로 나오므로 반올림해야 int()로 잘리지 않음
+            return 'milp', np.round(result.x), _solver_stats(result)
+        milp_message = str(result.message)
+
+    bounds = np.column_stack([np.zeros(len(costs)), upper_bounds])
+    result = linprog(costs, A_eq=A_eq, b_eq=b_eq, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method='highs')
+    if not result.success:
+        raise OptimizationError("Optimization failed.")
+
+    # linprog 결과에도 MIP 항목(0)이 들어 있으므로 LP 통계에서는 제외
+    stats = {key: value for key, value in _solver_stats(result).items() if not key.startswith('mip_')}
+    if integer_mode:
+        stats['milp_message'] = milp_message  # LP로 대신 푼 이유
+    # 제약 행렬이 완전 단모듈러이므로 LP 꼭짓점 해도 정수이며, MILP 해와 같이 반올림해야 int()로 잘리지 않음
+    return 'lp', np.round(result.x), stats
+
+
+def solve_sensitivity(costs, A_eq, b_eq, A_ub, b_ub, upper_bounds):
+    """LP를 HiGHS로 한 번 풀어 (해, 수요 제약 쌍대값, 용량 제약 쌍대값, 축소 비용)을 돌려주는 함수
+
+    각 열은 수요 행 하나와 용량 행 하나에만 계수 1로 들어가므로 (이분 그래프의 접속 행렬) 제약 행렬은
+    완전 단모듈러이고, LP 해와 쌍대값은 정수 배차(MILP) 문제에서도 그대로 성립합니다.
+    쌍대값은 제약 우변이 1 늘 때의 총비용 변화량이고, 축소 비용은 열의 운임이 그만큼 내려가야 선택될 수 있다는 뜻입니다.
+    """
+    bounds = np.column_stack([np.zeros(len(costs)), upper_bounds])
+    result = linprog(costs, A_eq=A_eq, b_eq=b_eq, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method='highs')
+    if not result.success:
+        raise OptimizationError(f"Sensitivity analysis failed: {result.message}")
+
+    capacity_duals = result.ineqlin.marginals if A_ub is not None else np.zeros(0)
+    return result.x, result.eqlin.marginals, capacity_duals, result.lower.marginals
+
+
+def merge_solver_stats(stats_list):
+    """부분 문제별 풀이 통계를 합치는 함수 (반복/노드 수는 합계, MIP 갭은 최댓값)"""
+    merged = {'blocks': len(stats_list), 'status': max(stats['status'] for stats in stats_list),
+              'message': "; ".join(sorted({stats['message'] for stats in stats_list}))}
+    for key in ('nit', 'mip_node_count', 'fun'):
+        values = [stats[key] for stats in stats_list if key in stats]
+        if values:
+            merged[key] = sum(values)
+    gaps = [stats['mip_gap'] for stats in stats_list if 'mip_gap' in stats]
+    if gaps:
+        merged['mip_gap'] = max(gaps)
+    return merged
+
+
+def _solve_model_in_child(conn, args):
+    """별도 프로세스에서 solve_model을 실행하고 결과나 오류를 파이프로 돌려주는 함수"""
+    try:
+        conn.send(("done", solve_model(*args)))
+    except PlanningError as e:
+        conn.send(("error", e))
+    except Exception as e:
+        conn.send(("error", OptimizationError(f"Optimization failed: {e}")))
+    finally:
+        conn.close()
+
+
+def check_cancelled(cancel_event):
+    """취소 요청이 있으면 PlanningCancelled를 발생시키는 함수"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise PlanningCancelled("The calculation was cancelled.")
+
+
+class CandidateStore:
+    """후보 운임 열 저장소
+
+    열마다 루트 번호, 운송사 코드, 운임만 배열로 보관하고, 우편번호/트럭 타입은 루트 목록에서,
+    운송사 이름은 운임 인덱스의 코드 표에서 찾으므로 같은 문자열을 열마다 복사하지 않습니다.
+    """
+
+    __slots__ = ("route_ids", "carrier_names", "route_codes", "carrier_codes", "costs")
+
+    def __init__(self, route_ids, route_codes, carrier_codes, costs, carrier_names):
+        self.route_ids = route_ids  # 루트 번호 -> (입력 우편번호, 트럭 타입)
+        self.carrier_names = carrier_names  # 운송사 코드 -> 운송사 이름 (RateIndex.carriers를 공유)
+        self.route_codes = np.asarray(route_codes, dtype=np.int32)  # 열 -> 루트 번호
+        self.carrier_codes = np.asarray(carrier_codes, dtype=np.int32)  # 열 -> 운송사 코드
+        self.costs = np.asarray(costs, dtype=float)  # 열 -> 운임
+
+    def __len__(self):
+        return len(self.costs)
+
+    def postal_code(self, i):
+        """i번째 열의 입력 우편번호를 돌려주는 함수"""
+        return self.route_ids[self.route_codes[i]][0]
+
+    def truck_type(self, i):
+        """i번째 열의 트럭 타입을 돌려주는 함수"""
+        return self.route_ids[self.route_codes[i]][1]
+
+    def carrier(self, i):
+        """i번째 열의 운송사 이름을 돌려주는 함수"""
+        return self.carrier_names[self.carrier_codes[i]]
+
+    def rows(self, assignments):
+        """배차된 열마다 (열 번호, 입력 우편번호, 운송사, 트럭 타입, 트럭 수, 비용)을 차례로 돌려주는 함수"""
+        assignments = np.asarray(assignments)
+        for i in np.flatnonzero(assignments > 0).tolist():
+            postal_code, truck_type = self.route_ids[self.route_codes[i]]
+            x = assignments[i]
+            yield i, postal_code, self.carrier_names[self.carrier_codes[i]], truck_type, int(x), float(self.costs[i] * x)
+
+
+class ShippingModel:
+    """후보 운임과 희소 제약 행렬을 보관하는 모델
+
+    제외 운송사와 가용 트럭 수는 행렬이 아니라 변수 상한과 b_ub로만 반영하므로,
+    같은 루트를 다시 계산할 때는 운임 조회와 행렬 구성 없이 바로 다시 풀 수 있습니다.
+    """
+
+    def __init__(self, route_ids, route_codes, carrier_codes, costs, rate_index):
+        """열(후보 운임)마다 루트 번호, 운송사 코드, 운임이 들어 있는 배열로 모델을 만드는 함수
+
+        제약 행렬의 좌표는 이 정수 코드에서 한 번에 계산하므로 구성 시간은 후보 운임 수에 비례합니다.
+        """
+        self.rate_index = rate_index  # 모델을 만들 때 사용한 운임 인덱스 (운임 DB가 바뀌면 모델도 다시 생성)
+        self.route_ids = list(route_ids)
+        self.num_data = len(costs)
+
+        # 결과 표시, 엑셀 내보내기, 저장은 모두 이 저장소에서 직접 읽음 (열별 이름 목록을 따로 만들지 않음)
+        self.candidates = CandidateStore(self.route_ids, route_codes, carrier_codes, costs, rate_index.carriers)
+        self.cost_vector = self.candidates.costs  # 운임 (cost) 벡터
+        self.route_codes = self.candidates.route_codes  # 열 -> 루트(수요 행) 번호
+        self.carrier_codes = self.candidates.carrier_codes  # 열 -> 운송사 코드 (rate_index.carriers)
+
+        # 루트의 트럭 타입을 정수 코드로 바꿈
+        type_codes = {}
+        route_type_codes = np.array([type_codes.setdefault(truck_type, len(type_codes))
+                                     for _, truck_type in self.route_ids], dtype=np.int64)
+        truck_types = list(type_codes)
+        column_type_codes = route_type_codes[self.route_codes] if self.num_data else np.zeros(0, dtype=np.int64)
+
+        # 가용 트럭 조회에 사용하는 모델 안의 운송사/트럭 타입 목록 (중복 없음)
+        carrier_names = rate_index.carriers
+        self.unique_carriers = [carrier_names[code] for code in np.unique(self.carrier_codes).tolist()]
+        self.unique_truck_types = sorted({truck_types[code] for code in np.unique(column_type_codes)}, key=str)
+
+        # 수요 제약: 각 후보 운임은 자신의 루트 행에 계수 1로 한 번만 들어감
+        columns = np.arange(self.num_data)
+        self.A_eq = coo_matrix((np.ones(self.num_data), (self.route_codes, columns)),
+                               shape=(len(self.route_ids), self.num_data)).tocsr()
+
+        # 용량 제약: (carrier, vehicle_type) 조합마다 한 행 (처음 나온 순서대로 행 번호 부여)
+        pair_keys = self.carrier_codes.astype(np.int64) * max(len(truck_types), 1) + column_type_codes
+        unique_keys, first_columns, inverse = np.unique(pair_keys, return_index=True, return_inverse=True)
+        order = np.argsort(first_columns, kind="stable")
+        pair_rows = np.empty(len(order), dtype=np.int64)
+        pair_rows[order] = np.arange(len(order))
+        ub_rows = pair_rows[inverse.reshape(-1)]
+        self.capacity_pairs = [(carrier_names[self.carrier_codes[column]], truck_types[column_type_codes[column]])
+                               for column in first_columns[order].tolist()]
+        self.A_ub = coo_matrix((np.ones(self.num_data), (ub_rows, columns)),
+                               shape=(len(self.capacity_pairs), self.num_data)).tocsr()
+
+        self._components = None  # (열 번호, 수요 행 번호, 용량 행 번호) 목록 - 처음 분해할 때 계산
+
+    def excluded_mask(self, excluded_carriers):
+        """(운송사, 입력 우편번호) 제외 목록에 해당하는 열을 표시하는 bool 배열을 만드는 함수"""
+        excluded = np.zeros(self.num_data, dtype=bool)
+        if not excluded_carriers or not self.num_data:
+            return excluded
+
+        # 모델에 있는 운송사의 제외 항목만 루트 번호로 바꾸고 (운송사 코드, 루트 번호)를 하나의 정수 키로 비교
+        route_rows = defaultdict(list)  # 입력 우편번호 -> 루트 번호 목록
+        for i, (postal_code, _) in enumerate(self.route_ids):
+            route_rows[postal_code].append(i)
+
+        num_routes = len(self.route_ids)
+        excluded_keys = [
+            self.rate_index.carrier_codes[carrier] * num_routes + route_row
+            for carrier, postal_code in excluded_carriers
+            if carrier in self.rate_index.carrier_codes
+            for route_row in route_rows.get(postal_code, ())
+        ]
+        if excluded_keys:
+            excluded = np.isin(self.carrier_codes.astype(np.int64) * num_routes + self.route_codes, excluded_keys)
+        return excluded
+
+    def components(self):
+        """수요 제약과 용량 제약으로 서로 연결되지 않는 독립 부분 문제들을 찾는 함수
+
+        같은 루트(수요 행)나 같은 (carrier, vehicle_type)(용량 행)을 공유하는 열끼리만 연결되므로
+        보통 트럭 타입별로 (또는 더 잘게) 나뉩니다. 열이 없는 수요 행(운임이 없는 루트)은 제외됩니다.
+        """
+        if self._components is None:
+            num_eq_rows = self.A_eq.shape[0]
+            rows = vstack([self.A_eq, self.A_ub]).tocsr()  # 제약 행 x 열
+            graph = bmat([[None, rows], [rows.T, None]])  # 제약 행과 열을 꼭짓점으로 하는 이분 그래프
+            count, labels = connected_components(graph, directed=False)
+
+            row_labels = labels[:rows.shape[0]]
+            column_labels = labels[rows.shape[0]:]
+            self._components = []
+            for label in np.unique(column_labels):
+                constraint_rows = np.flatnonzero(row_labels == label)
+                self._components.append((
+                    np.flatnonzero(column_labels == label),
+                    constraint_rows[constraint_rows < num_eq_rows],
+                    constraint_rows[constraint_rows >= num_eq_rows] - num_eq_rows
+                ))
+        return self._components
+
+    def split(self, num_blocks):
+        """독립 부분 문제들을 열 수가 비슷한 최대 num_blocks개 묶음으로 나누는 함수 (큰 것부터 가장 작은 묶음에 배정)"""
+        blocks = [[] for _ in range(min(num_blocks, len(self.components())))]
+        sizes = [0] * len(blocks)
+        for component in sorted(self.components(), key=lambda component: len(component[0]), reverse=True):
+            smallest = sizes.index(min(sizes))
+            blocks[smallest].append(component)
+            sizes[smallest] += len(component[0])
+
+        return [tuple(np.concatenate(parts) for parts in zip(*block)) for block in blocks]
+
+
+class HorizonModel:
+    """날짜별 ShippingModel을 블록 대각으로 쌓아 한 번에 푸는 다일(多日) 모델
+
+    수요 행과 용량 행은 날짜마다 따로 있으므로 각 날짜는 available_trucks 전체를 하루 용량으로 사용합니다.
+    날짜별 모델은 그대로 재사용되므로 계획을 하루씩 앞으로 옮길 때 행렬을 다시 만들 필요가 없습니다.
+    """
+
+    def __init__(self, dates, day_models):
+        self.dates = list(dates)
+        self.day_models = list(day_models)
+        sizes = [model.num_data for model in self.day_models]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)  # 날짜별 첫 열 번호
+        self.num_data = int(self.offsets[-1])
+
+        self.cost_vector = np.concatenate([model.cost_vector for model in self.day_models])
+        self.A_eq = block_diag([model.A_eq for model in self.day_models], format="csr")
+        self.A_ub = block_diag([model.A_ub for model in self.day_models], format="csr")
+        self._components = None
+
+    def components(self):
+        """날짜별 모델의 독립 부분 문제를 전체 모델의 열/행 번호로 옮겨 모으는 함수"""
+        if self._components is None:
+            self._components = []
+            eq_offset = ub_offset = 0
+            for model, column_offset in zip(self.day_models, self.offsets):
+                for columns, eq_rows, ub_rows in model.components():
+                    self._components.append((columns + column_offset, eq_rows + eq_offset, ub_rows + ub_offset))
+                eq_offset += model.A_eq.shape[0]
+                ub_offset += model.A_ub.shape[0]
+        return self._components
+
+    split = ShippingModel.split
+
+    def day_columns(self, day):
+        """day번째 날짜의 열 범위를 돌려주는 함수"""
+        return slice(self.offsets[day], self.offsets[day + 1])
+
+
+class ShippingEngine:
+    """GUI 없이 운임 조회와 배차 최적화를 수행하는 엔진"""
+
+    def __init__(self, database_path=DATABASE_PATH, cache_dir=None, result_cache_dir=None, wal=False):
+        # wal은 database_path가 이 컴퓨터에서만 쓰는 로컬 폴더일 때만 지정 (공유 폴더 파일은 기본 저널 유지)
+        self.excluded_carriers_db = DatabaseManager(f"{database_path}/excluded_carriers.db", wal)
+        self.available_trucks_db = DatabaseManager(f"{database_path}/available_trucks.db", wal)
+        self.shipping_postal_codes_db = DatabaseManager(f"{database_path}/shipping_postal_codes.db", wal)
+        self.carrier_assignment_db = DatabaseManager(f"{database_path}/Carrier_assignment.db", wal)
+
+        self.excluded_carriers = set()  # (carrier, input postal code)
+        self.rate_index = None  # 운임 조회 인덱스 (운임 DB가 바뀔 때만 다시 로드)
+        self.rate_catalog = None  # 우편번호/트럭 타입 목록 (운임 DB가 바뀔 때만 다시 로드)
+        self.last_model = None  # 마지막으로 만든 ShippingModel (같은 루트를 다시 계산할 때 재사용)
+        self.day_models = {}  # 다일 계획의 날짜별 ShippingModel (루트 목록 -> 모델, 다음 계획에서 재사용)
+        self.metrics = PlanMetrics()  # 진행 중인 계산의 성능 기록 (plan()마다 새로 만듦)
+        self.last_metrics = None  # 마지막으로 끝난 계산의 성능 기록
+
+        # 정수 배차 (MILP) 설정 - integer_mode가 False이면 기존처럼 LP만 사용
+        self.integer_mode = True
+        self.mip_time_limit = MIP_TIME_LIMIT
+        self.mip_gap = MIP_REL_GAP
+
+        # decompose가 True이면 큰 모델을 독립 부분 문제로 나눠 프로세스 풀에서 병렬로 풂
+        self.decompose = False
+        self.max_workers = os.cpu_count() or 1
+        self.solver_pool = None  # 처음 병렬 풀이할 때 생성
+
+        # cache_dir을 지정하면 운임 DB를 로컬 사본에서 읽음
+        self.rate_cache = None
+        if cache_dir:
+            self.rate_cache = LocalDatabaseCache(f"{database_path}/shipping_postal_codes.db", cache_dir,
+                                                 migrations=SHIPPING_POSTAL_CODES_MIGRATIONS)
+
+        # 같은 입력(루트, 제외 운송사, 가용 트럭/배차 버전, 운임 DB, 풀이 설정)의 계획 결과를 재사용
+        # result_cache_dir을 지정하면 디스크에도 보관
+        self.result_cache = ResultCache(disk_dir=result_cache_dir)
+
+    def init_db(self):
+        """각 DB에 테이블, 인덱스, 고유 키를 만들거나 최신 스키마 버전으로 올리는 함수"""
+        try:
+            migrate(self.excluded_carriers_db, EXCLUDED_CARRIERS_MIGRATIONS)
+            migrate(self.carrier_assignment_db, CARRIER_ASSIGNMENT_MIGRATIONS)
+            migrate(self.available_trucks_db, AVAILABLE_TRUCKS_MIGRATIONS)
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to update the database schema: {e}") from e
+
+        # 운임 DB 원본은 수정하지 않음 (원본이 바뀌면 모든 PC의 로컬 사본이 무효가 되므로)
+        # 조회용 인덱스는 로컬 사본을 만들 때 사본에 만들고, 원본에는 migrate_rate_database()로만 만듦
+
+    def migrate_rate_database(self):
+        """운임 DB 원본에 조회용 인덱스를 만드는 함수 (관리 작업 - 로컬 사본 없이 원본을 직접 읽는 경우에만 필요)
+
+        적용한 마이그레이션 단계 수를 돌려줍니다.
+        """
+        rate_path = self.rate_cache.master_path if self.rate_cache else self.shipping_postal_codes_db.db_path
+        rate_db = DatabaseManager(rate_path)
+        try:
+            return migrate(rate_db, SHIPPING_POSTAL_CODES_MIGRATIONS)
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to index the shipping rate database: {e}") from e
+        finally:
+            if self.rate_cache:
+                rate_db.discard()  # 운임은 로컬 사본에서 읽으므로 원본 연결은 유지하지 않음
+
+    def get_excluded_carriers(self):
+        """데이터베이스에서 제외된 운송사 목록을 가져오는 함수"""
+        self.excluded_carriers_db.connect()
+        try:
+            with self.metrics.db_call("excluded_carriers", self.excluded_carriers_db) as call:
+                cursor = self.excluded_carriers_db.execute_query(
+                    'SELECT carrier, destination_postal_code FROM excluded_carriers'
+                )
+                rows = cursor.fetchall()
+                call['rows'] = len(rows)
+            return {(row[0], row[1]) for row in rows}
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to retrieve excluded carriers: {e}") from e
+        finally:
+            self.excluded_carriers_db.close()
+
+    def get_assigned_trucks(self):
+        """운송사와 트럭 타입별로 이미 할당된 트럭 수를 가져오는 함수 (트리거로 유지되는 합계 테이블을 읽음)"""
+        assigned_trucks = defaultdict(lambda: defaultdict(int))  # carrier -> truck_type -> assigned_trucks
+        self.carrier_assignment_db.connect()
+
+        try:
+            with self.metrics.db_call("assigned_trucks", self.carrier_assignment_db) as call:
+                cursor = self.carrier_assignment_db.execute_query(
+                    'SELECT carrier, type, assigned_truck FROM assigned_trucks')
+                rows = cursor.fetchall()
+                call['rows'] = len(rows)
+
+            # 각 운송사 및 트럭 타입별로 할당된 트럭 수를 기록
+            for row in rows:
+                carrier = row[0]
+                truck_type = row[1]
+                total_assigned = row[2]
+                assigned_trucks[carrier][truck_type] = total_assigned
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to retrieve assigned trucks: {e}") from e
+        finally:
+            self.carrier_assignment_db.close()
+
+        return assigned_trucks
+
+    def get_rate_database(self):
+        """운임 DB 관리자를 돌려주는 함수 (로컬 캐시 모드에서는 원본이 바뀐 경우 사본을 갱신)"""
+        if self.rate_cache is not None:
+            try:
+                with self.metrics.db_call("rate_cache_refresh", DatabaseManager(self.rate_cache.master_path)):
+                    changed = self.rate_cache.refresh()
+            except (OSError, sqlite3.Error) as e:
+                raise DatabaseError(f"Failed to cache shipping rates: {e}") from e
+
+            if changed:
+                if self.shipping_postal_codes_db.db_path != self.rate_cache.master_path:
+                    self.shipping_postal_codes_db.discard()  # 이전 사본에 대한 연결 정리
+                self.shipping_postal_codes_db = DatabaseManager(self.rate_cache.local_path, wal=True)  # 로컬 사본
+                self.rate_index = None
+                self.rate_catalog = None
+        return self.shipping_postal_codes_db
+
+    def get_rate_index(self):
+        """운임 인덱스를 처음 사용할 때 (또는 운임 DB가 바뀐 뒤) 한 번만 로드하는 함수"""
+        rate_db = self.get_rate_database()
+        if self.rate_index is None:
+            try:
+                with self.metrics.db_call("rate_index_load", rate_db) as call:
+                    self.rate_index = RateIndex.load(rate_db)
+                    call['rows'] = self.rate_index.row_count
+            except sqlite3.Error as e:
+                raise DatabaseError(f"Failed to retrieve shipping rates: {e}") from e
+        return self.rate_index
+
+    def get_rate_catalog(self):
+        """우편번호/트럭 타입 카탈로그를 처음 사용할 때 (또는 운임 DB가 바뀐 뒤) 한 번만 로드하는 함수"""
+        rate_db = self.get_rate_database()
+        if self.rate_catalog is None:
+            try:
+                with self.metrics.db_call("rate_catalog_load", rate_db) as call:
+                    self.rate_catalog = RateCatalog.load(rate_db)
+                    call['rows'] = len(self.rate_catalog.postal_codes) + len(self.rate_catalog.truck_types)
+            except sqlite3.Error as e:
+                raise DatabaseError(f"Failed to retrieve postal codes and truck types: {e}") from e
+        return self.rate_catalog
+
+    def fetch_shipping_rates(self, destination, truck_types):
+        """해당 목적지와 트럭 타입에 대한 운송사 정보를 가져오는 함수"""
+        results = self.fetch_shipping_rates_batch([(destination, truck_type) for truck_type in truck_types])
+
+        data = []
+        for rows in results.values():
+            data.extend(rows)
+        return data
+
+    def fetch_shipping_rates_batch(self, routes):
+        """(목적지, 트럭 타입) 목록 전체의 운송사 정보를 한 번에 가져오는 함수
+
+        운임 인덱스가 이미 로드되어 있으면 메모리에서 조회하고, 아직 없으면 전체 운임 표를 읽지 않고
+        fetch_shipping_rates_sql로 필요한 루트만 한 번의 쿼리로 가져옵니다.
+        """
+        if self.rate_index is None:
+            return self.fetch_shipping_rates_sql(routes)
+        rate_index = self.get_rate_index()
+
+        results = {}
+        for (destination, truck_type), rows in rate_index.lookup_many(routes).items():
+            # 특정 input postal code에 대한 운송사만 제외 (범위 제외 대신)
+            # 중복된 carrier, vehicle_type, cost 조합은 인덱스 생성 시 이미 제거됨
+            results[(destination, truck_type)] = [
+                row for row in rows if (row[0], destination) not in self.excluded_carriers
+            ]
+        return results
+
+    def fetch_shipping_rates_sql(self, routes):
+        """(목적지, 트럭 타입) 목록을 임시 테이블에 넣고 shipping_postal_codes와 한 번 조인하여 운임을 가져오는 함수
+
+        제외 운송사 필터와 (carrier, cost) 중복 제거(먼저 나온 행 유지)도 같은 쿼리에서 처리하므로
+        결과는 운임 인덱스 조회(fetch_shipping_rates_batch)와 같습니다.
+        """
+        routes = list(dict.fromkeys(routes))
+        results = {route: [] for route in routes}
+        if not routes:
+            return results
+
+        rate_db = self.get_rate_database()
+        conn = rate_db.connect()
+        try:
+            with self.metrics.db_call("rate_batch_fetch", rate_db) as call:
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS rate_routes '
+                             '(route INTEGER PRIMARY KEY, postal_code INTEGER, truck_type TEXT)')
+                conn.execute('CREATE TEMP TABLE IF NOT EXISTS rate_exclusions '
+                             '(carrier TEXT, postal_code INTEGER, PRIMARY KEY (carrier, postal_code))')
+                # 임시 테이블의 행은 close()의 롤백으로 지워짐
+                conn.executemany('INSERT INTO temp.rate_routes (route, postal_code, truck_type) VALUES (?, ?, ?)',
+                                 [(i,) + route for i, route in enumerate(routes)])
+                conn.executemany('INSERT OR IGNORE INTO temp.rate_exclusions (carrier, postal_code) VALUES (?, ?)',
+                                 list(self.excluded_carriers))
+                # 대부분인 단일 우편번호 행은 동등 검색으로, 좁은/넓은 구간은 각각의 부분 인덱스로 찾고
+                # 루트, carrier, cost별로 rowid가 가장 작은 행만 남김 (MIN과 함께 쓴 열은 그 행의 값)
+                rows = conn.execute(f'''
+                    SELECT route, carrier, vehicle_type, origin, start_postal_code, end_postal_code, cost,
+                           MIN(rate_row) AS first_row
+                    FROM (
+                        SELECT r.route, r.postal_code, s.rowid AS rate_row, s.*
+                        FROM temp.rate_routes r CROSS JOIN shipping_postal_codes s
+                        WHERE s.vehicle_type = r.truck_type
+                          AND s.start_postal_code = r.postal_code
+                          AND s.end_postal_code = r.postal_code
+                        UNION ALL
+                        SELECT r.route, r.postal_code, s.rowid AS rate_row, s.*
+                        FROM temp.rate_routes r CROSS JOIN shipping_postal_codes s
+                        WHERE s.vehicle_type = r.truck_type
+                          AND s.start_postal_code BETWEEN r.postal_code - {NARROW_RATE_RANGE} AND r.postal_code
+                          AND s.end_postal_code >= r.postal_code
+                          AND s.end_postal_code > s.start_postal_code
+                          AND s.end_postal_code - s.start_postal_code <= {NARROW_RATE_RANGE}
+                        UNION ALL
+                        SELECT r.route, r.postal_code, s.rowid AS rate_row, s.*
+                        FROM temp.rate_routes r CROSS JOIN shipping_postal_codes s
+                        WHERE s.vehicle_type = r.truck_type
+                          AND s.start_postal_code <= r.postal_code
+                          AND s.end_postal_code >= r.postal_code
+                          AND s.end_postal_code - s.start_postal_code > {NARROW_RATE_RANGE}
+                    ) AS m
+                    WHERE NOT EXISTS (SELECT 1 FROM temp.rate_exclusions x
+                                      WHERE x.carrier = m.carrier AND x.postal_code = m.postal_code)
+                    GROUP BY route, carrier, cost
+                    ORDER BY route, first_row
+                ''').fetchall()
+                call['rows'] = len(rows)
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to retrieve shipping rates: {e}") from e
+        finally:
+            rate_db.close()
+
+        for route, *row, _ in rows:
+            results[routes[route]].append(tuple(row))
+        return results
+
+    def fetch_carrier_limits(self, carriers, truck_types):
+        """운송사와 트럭 타입별 최대 배차 가능 수를 계산하는 함수
+
+        available_trucks는 저장 시 차감되고 리셋/삭제 시 다시 더해지는 남은 트럭 수이므로
+        Carrier_assignment 이력을 다시 빼지 않습니다 (이미 할당된 수는 get_assigned_trucks로 조회).
+        """
+        carrier_limits = defaultdict(lambda: defaultdict(int))  # carrier -> truck_type -> limit
+        self.available_trucks_db.connect()
+
+        try:
+            cursor = self.available_trucks_db.conn.cursor()
+            query = '''
+                SELECT carrier, truck_type, SUM(total_trucks) FROM available_trucks
+                WHERE carrier IN ({carrier_seq}) AND truck_type IN ({truck_type_seq})
+                GROUP BY carrier, truck_type
+            '''
+            # carriers와 truck_types를 각각의 쿼리에 맞게 placeholders로 설정
+            query = query.format(
+                carrier_seq=','.join('?' * len(carriers)),
+                truck_type_seq=','.join('?' * len(truck_types))
+            )
+            with self.metrics.db_call("carrier_limits", self.available_trucks_db) as call:
+                cursor.execute(query, carriers + truck_types)
+                rows = cursor.fetchall()
+                call['rows'] = len(rows)
+
+            for carrier, truck_type, limit in rows:
+                carrier_limits[carrier][truck_type] = max(limit, 0)  # 음수가 되지 않도록 함
+
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to retrieve carrier limits: {e}") from e
+        finally:
+            self.available_trucks_db.close()
+
+        return carrier_limits
+
+    def assignment_rows(self, result):
+        """최적화 결과에서 저장할 (postal code, carrier, truck type, assigned trucks) 행을 만드는 함수"""
+        rows = result['candidates'].rows(result['assignments'])
+        return [(postal_code, carrier, truck_type, assigned_trucks)
+                for _, postal_code, carrier, truck_type, assigned_trucks, _ in rows]
+
+    def save_assignments(self, result, time_stamp=None, run_id=None):
+        """배차 결과를 Carrier_assignment에 저장하고 available_trucks에서 차감하는 함수 (저장한 행 수를 돌려줌)"""
+        return self.save_assignment_rows(self.assignment_rows(result), time_stamp, run_id)
+
+    def save_assignment_rows(self, rows, time_stamp=None, run_id=None, replace=False):
+        """(postal code, carrier, truck type, assigned trucks) 행을 저장하고 available_trucks에서 차감하는 함수
+
+        모든 INSERT와 (carrier, truck type)별 차감은 하나의 트랜잭션으로 처리되며,
+        트럭이 부족한 조합이 하나라도 있으면 아무것도 저장하지 않습니다.
+        time_stamp를 주지 않으면 현재 시간을 Time으로 기록합니다. run_id를 주면 행에 함께 기록하여
+        release_assignments(run_id=...)로 이 저장분만 되돌릴 수 있습니다. replace가 True이면 같은 run_id로
+        저장된 행을 같은 트랜잭션에서 먼저 되돌립니다. 저장한 행 수를 돌려줍니다.
+        """
+        if replace and run_id is None:
+            raise InputError("A run ID is required to replace assignments.")
+        if not rows and not replace:
+            return 0
+
+        current_time = time_stamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # 현재 날짜와 시간 가져오기
+
+        # 운송사와 트럭 타입별로 차감할 트럭 수를 합산
+        decrements = defaultdict(int)
+        for postal_code, carrier, truck_type, assigned_truck in rows:
+            decrements[(carrier, truck_type)] += assigned_truck
+
+        conn = self.carrier_assignment_db.connect()
+        try:
+            # 두 DB 파일을 하나의 트랜잭션으로 커밋하기 위해 available_trucks.db를 연결
+            conn.execute("ATTACH DATABASE ? AS trucks", (self.available_trucks_db.db_path,))
+            try:
+                with self.carrier_assignment_db.transaction():
+                    if replace:
+                        self.release_rows(conn, 'run_id = ?', (run_id,))
+                    available = {
+                        (carrier, truck_type): total_trucks
+                        for carrier, truck_type, total_trucks in conn.execute(
+                            'SELECT carrier, truck_type, MIN(total_trucks) FROM trucks.available_trucks '
+                            'GROUP BY carrier, truck_type')
+                    }
+                    for (carrier, truck_type), assigned_truck in decrements.items():
+                        # 남은 트럭 수가 0 이상이어야 함
+                        if (carrier, truck_type) in available and available[(carrier, truck_type)] < assigned_truck:
+                            raise PlanningError(f"Not enough trucks available for {carrier} ({truck_type})")
+
+                    if not rows:
+                        return 0
+                    conn.executemany(
+                        'INSERT INTO Carrier_assignment (postal_code, carrier, type, assigned_truck, Time, run_id) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        [row + (current_time, run_id) for row in rows]
+                    )
+                    conn.executemany(
+                        'UPDATE trucks.available_trucks SET total_trucks = total_trucks - ? '
+                        'WHERE carrier = ? AND truck_type = ?',
+                        [(assigned_truck, carrier, truck_type)
+                         for (carrier, truck_type), assigned_truck in decrements.items()]
+                    )
+            finally:
+                conn.execute("DETACH DATABASE trucks")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to save data: {e}") from e
+        finally:
+            self.carrier_assignment_db.close()
+
+        return len(rows)
+
+    def release_assignments(self, time_stamp=None, run_id=None):
+        """Time이 time_stamp인 (또는 run_id로 저장한) 배차를 지우고 그 트럭 수를 available_trucks에 다시 더하는 함수
+
+        'Reset Carrier Assignment'와 같은 작업을 하나의 트랜잭션으로 처리합니다. 둘 다 주면 두 조건을 모두 만족하는
+        행만 지웁니다. 지운 행 수를 돌려줍니다.
+        """
+        conditions = [(column, value) for column, value in (('Time', time_stamp), ('run_id', run_id))
+                      if value is not None]
+        if not conditions:
+            raise InputError("A time stamp or run ID is required to release assignments.")
+        where = " AND ".join(f"{column} = ?" for column, _ in conditions)
+        params = tuple(value for _, value in conditions)
+
+        conn = self.carrier_assignment_db.connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS trucks", (self.available_trucks_db.db_path,))
+            try:
+                with self.carrier_assignment_db.transaction():
+                    deleted = self.release_rows(conn, where, params)
+            finally:
+                conn.execute("DETACH DATABASE trucks")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to reset data: {e}") from e
+        finally:
+            self.carrier_assignment_db.close()
+
+        return deleted
+
+    @staticmethod
+    def release_rows(conn, where, params):
+        """열린 트랜잭션 안에서 where에 맞는 배차를 지우고 트럭 수를 trucks.available_trucks에 되돌리는 함수"""
+        conn.executemany(
+            'UPDATE trucks.available_trucks SET total_trucks = total_trucks + ? '
+            'WHERE carrier = ? AND truck_type = ?',
+            [(assigned_truck, carrier, truck_type) for carrier, truck_type, assigned_truck in conn.execute(
+                f'SELECT carrier, type, SUM(assigned_truck) FROM Carrier_assignment WHERE {where} '
+                'GROUP BY carrier, type', params).fetchall()]
+        )
+        return conn.execute(f'DELETE FROM Carrier_assignment WHERE {where}', params).rowcount
+
+    def delete_assignment(self, postal_code, carrier):
+        """postal_code와 carrier의 배차를 지우고 그 트럭 수를 available_trucks에 다시 더하는 함수
+
+        지우는 모든 행의 트럭 수를 트럭 타입별로 합산해 하나의 트랜잭션으로 되돌립니다. 지운 행 수를 돌려줍니다.
+        """
+        conn = self.carrier_assignment_db.connect()
+        try:
+            conn.execute("ATTACH DATABASE ? AS trucks", (self.available_trucks_db.db_path,))
+            try:
+                with self.carrier_assignment_db.transaction():
+                    conn.executemany(
+                        'UPDATE trucks.available_trucks SET total_trucks = total_trucks + ? '
+                        'WHERE carrier = ? AND truck_type = ?',
+                        [(assigned_truck, carrier, truck_type) for carrier, truck_type, assigned_truck in conn.execute(
+                            'SELECT carrier, type, SUM(assigned_truck) FROM Carrier_assignment '
+                            'WHERE postal_code = ? AND carrier = ? GROUP BY carrier, type',
+                            (postal_code, carrier)).fetchall()]
+                    )
+                    deleted = conn.execute('DELETE FROM Carrier_assignment WHERE postal_code = ? AND carrier = ?',
+                                           (postal_code, carrier)).rowcount
+            finally:
+                conn.execute("DETACH DATABASE trucks")
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to delete the assignment: {e}") from e
+        finally:
+            self.carrier_assignment_db.close()
+
+        return deleted
+
+    def combine_routes(self, demands):
+        """동일한 postal code와 truck type의 수요를 합산하는 함수"""
+        combined_routes = defaultdict(lambda: {'trucks': 0, 'postal_code': None, 'truck_type': None})
+
+        for entry in demands:
+            key = (entry['postal_code'], entry['truck_type'])  # postal code와 truck type을 키로 사용
+            combined_routes[key]['trucks'] += entry['trucks']  # 트럭 수 합산
+            combined_routes[key]['postal_code'] = entry['postal_code']
+            combined_routes[key]['truck_type'] = entry['truck_type']
+
+        return list(combined_routes.values())
+
+    def data_versions(self):
+        """available_trucks와 Carrier_assignment의 변경 버전을 읽는 함수 (트리거가 없거나 읽지 못하면 None)"""
+        versions = {}
+        try:
+            for db_manager in (self.available_trucks_db, self.carrier_assignment_db):
+                with self.metrics.db_call("data_version", db_manager) as call:
+                    db_manager.connect()
+                    try:
+                        rows = db_manager.conn.execute('SELECT name, version FROM data_version').fetchall()
+                    finally:
+                        db_manager.close()
+                    call['rows'] = len(rows)
+                versions.update(rows)
+        except sqlite3.Error:
+            return None
+        return versions
+
+    def result_key(self, route_ids, truck_requirements, rate_db):
+        """계획 결과 캐시 키 (입력과 결과에 영향을 주는 상태의 해시)를 만드는 함수
+
+        가용 트럭 또는 배차 이력이 바뀌었는지 확인할 수 없으면 None을 돌려주며 캐시를 사용하지 않습니다.
+        """
+        versions = self.data_versions()
+        if not versions:
+            return None
+        try:
+            rate_stat = os.stat(rate_db.db_path)
+            # 데이터 폴더가 달라도 버전 번호는 같을 수 있으므로 DB 파일의 절대 경로와 파일 식별자도 키에 포함
+            databases = []
+            for db_manager in (self.carrier_assignment_db, self.available_trucks_db, self.excluded_carriers_db):
+                db_stat = os.stat(db_manager.db_path)
+                databases.append([os.path.abspath(db_manager.db_path), db_stat.st_dev, db_stat.st_ino])
+        except OSError:
+            return None
+
+        key = {
+            'databases': databases,
+            'routes': sorted((str(postal_code), str(truck_type), trucks)
+                             for (postal_code, truck_type), trucks in zip(route_ids, truck_requirements)),
+            'excluded': sorted((str(carrier), str(postal_code)) for carrier, postal_code in self.excluded_carriers),
+            'versions': sorted(versions.items()),
+            'rates': [rate_db.db_path, rate_stat.st_mtime_ns, rate_stat.st_size],
+            'solver': [self.integer_mode, self.mip_time_limit, self.mip_gap]
+        }
+        return hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()
+
+    def plan(self, demands, progress=None, cancel_event=None):
+        """수요 목록({'postal_code', 'trucks', 'truck_type'})에 대한 최적 배차를 계산하는 함수
+
+        운임이 없는 루트는 결과의 'missing_routes'에 담기고 나머지 루트만 최적화됩니다.
+        입력 루트가 이전 계산과 같으면 이전 모델을 재사용하여 제외 운송사와 가용 트럭 수만 다시 반영합니다.
+        루트, 제외 운송사, 가용 트럭/배차 버전이 모두 같은 계산을 이미 했다면 저장된 결과를 바로 돌려줍니다
+        (결과의 'cached'가 True).
+        progress는 PLAN_STAGES의 각 단계를 시작할 때 단계 이름으로 호출되며 (작업 스레드에서 호출됨),
+        cancel_event(threading.Event)가 설정되면 단계 사이 또는 풀이 도중에 PlanningCancelled가 발생합니다.
+        """
+        metrics = self.metrics = PlanMetrics()
+        try:
+            input_destination = self.combine_routes(demands)
+            if not input_destination:
+                raise InputError("Please enter all fields including destination, truck count, and truck type.")
+
+            rate_lookup, model_build, solve = PLAN_STAGES
+            if progress:
+                progress(rate_lookup)
+            with metrics.stage(rate_lookup):
+                self.excluded_carriers.update(self.get_excluded_carriers())
+
+                route_ids = [(entry['postal_code'], entry['truck_type']) for entry in input_destination]
+                truck_requirements = [entry['trucks'] for entry in input_destination]
+
+                rate_index = self.get_rate_index()
+                result_key = self.result_key(route_ids, truck_requirements, self.shipping_postal_codes_db)
+                cached = self.result_cache.get(result_key) if result_key else None
+            if cached is not None:
+                metrics.plan = {'routes': len(route_ids), 'columns': len(cached['candidates']), 'result_cache': "hit"}
+                return dict(cached, cached=True)
+            check_cancelled(cancel_event)
+
+            if progress:
+                progress(model_build)
+            with metrics.stage(model_build):
+                model = self.last_model
+                if model is None or model.rate_index is not rate_index or model.route_ids != route_ids:
+                    model = self.build_shipping_model(rate_index, route_ids)
+                    self.last_model = model
+            metrics.plan = {'routes': len(route_ids), 'columns': model.num_data}
+            check_cancelled(cancel_event)
+
+            if progress:
+                progress(solve)
+            result = self.optimize_shipping(model, truck_requirements, cancel_event)
+            if result_key:
+                self.result_cache.put(result_key, result)
+                metrics.plan['result_cache'] = "miss"
+            return result
+        except PlanningError as e:
+            metrics.error = f"{e.title}: {e}"
+            raise
+        finally:
+            # 계산 밖의 조회(운송사 상세 정보 등)가 이 기록에 섞이지 않도록 새 기록으로 교체
+            self.last_metrics = metrics
+            self.metrics = PlanMetrics()
+
+    def route_bounds(self, model, truck_requirements):
+        """제외 운송사를 반영한 열 상한, 수요 벡터, 운임이 없는 루트 목록을 만드는 함수"""
+        # 제외된 운송사의 열은 모델에서 빼지 않고 상한을 0으로 고정
+        excluded = model.excluded_mask(self.excluded_carriers)
+
+        # 선택 가능한 운송사가 하나도 없는 루트는 수요를 0으로 두고 missing_routes로 보고
+        available_columns = model.A_eq @ (~excluded).astype(float)
+        missing = available_columns == 0
+        missing_routes = [route for route, is_missing in zip(model.route_ids, missing) if is_missing]
+        return np.where(excluded, 0, np.inf), np.where(missing, 0, truck_requirements), missing_routes
+
+    def plan_horizon(self, demands, progress=None, cancel_event=None):
+        """여러 날짜의 수요({'date', 'postal_code', 'trucks', 'truck_type'})를 하나의 모델로 계획하는 함수
+
+        날짜마다 available_trucks 전체를 하루 용량으로 사용합니다. 날짜별 모델은 루트 목록이 같으면
+        이전 계획의 것을 재사용하므로, 하루씩 앞으로 옮긴 계획에서는 새 날짜의 모델만 만듭니다.
+        결과의 'days'에는 날짜 순서대로 plan()과 같은 형식의 결과가 들어 있고,
+        'missing_routes'에는 운임이 없는 (date, postal code, truck type)이 담깁니다.
+        """
+        metrics = self.metrics = PlanMetrics()
+        try:
+            demands_by_date = defaultdict(list)
+            for entry in demands:
+                demands_by_date[entry['date']].append(entry)
+            dates = sorted(demands_by_date)
+            day_routes = [self.combine_routes(demands_by_date[date]) for date in dates]
+            if not dates or not all(day_routes):
+                raise InputError("Please enter all fields including date, destination, truck count, and truck type.")
+
+            rate_lookup, model_build, solve = PLAN_STAGES
+            if progress:
+                progress(rate_lookup)
+            with metrics.stage(rate_lookup):
+                self.excluded_carriers.update(self.get_excluded_carriers())
+                rate_index = self.get_rate_index()
+            check_cancelled(cancel_event)
+
+            if progress:
+                progress(model_build)
+            with metrics.stage(model_build):
+                day_route_ids = [tuple((entry['postal_code'], entry['truck_type']) for entry in routes)
+                                 for routes in day_routes]
+                day_models = {}
+                for route_ids in day_route_ids:
+                    model = day_models.get(route_ids) or self.day_models.get(route_ids)
+                    if model is None or model.rate_index is not rate_index:
+                        model = self.build_shipping_model(rate_index, route_ids)
+                    day_models[route_ids] = model
+                self.day_models = day_models  # 이번 계획에 없는 루트 목록의 모델은 버림
+                horizon = HorizonModel(dates, [day_models[route_ids] for route_ids in day_route_ids])
+            metrics.plan = {'days': len(dates), 'routes': sum(map(len, day_routes)), 'columns': horizon.num_data}
+            check_cancelled(cancel_event)
+
+            if progress:
+                progress(solve)
+            return self.optimize_horizon(horizon, [[entry['trucks'] for entry in routes] for routes in day_routes],
+                                         cancel_event)
+        except PlanningError as e:
+            metrics.error = f"{e.title}: {e}"
+            raise
+        finally:
+            self.last_metrics = metrics
+            self.metrics = PlanMetrics()
+
+    def optimize_horizon(self, horizon, day_requirements, cancel_event=None):
+        """다일 모델에 제외 운송사와 날짜별 가용 트럭 수를 반영하여 한 번에 최적화하는 함수"""
+        bounds = [self.route_bounds(model, requirements)
+                  for model, requirements in zip(horizon.day_models, day_requirements)]
+        missing_routes = [(date,) + route for date, (_, _, missing) in zip(horizon.dates, bounds) for route in missing]
+        if len(missing_routes) == sum(len(model.route_ids) for model in horizon.day_models):
+            raise OptimizationError("\n".join(
+                f"No data found for the postal code {destination} and truck type {truck_type} on {date}."
+                for date, destination, truck_type in missing_routes))
+
+        # 가용 트럭 수는 한 번만 조회하고 모든 날짜의 용량 행에 같은 값을 사용
+        carriers = sorted({carrier for model in horizon.day_models for carrier in model.unique_carriers}, key=str)
+        truck_types = sorted({truck_type for model in horizon.day_models for truck_type in model.unique_truck_types},
+                             key=str)
+        with self.metrics.stage("Carrier limits"):
+            carrier_limits = self.fetch_carrier_limits(carriers, truck_types)
+        A_ub, b_ub = None, None
+        if carrier_limits:
+            A_ub = horizon.A_ub
+            b_ub = [carrier_limits.get(carrier, {}).get(truck_type, 0)
+                    for model in horizon.day_models for carrier, truck_type in model.capacity_pairs]
+
+        upper_bounds = np.concatenate([upper for upper, _, _ in bounds])
+        b_eq = np.concatenate([demand for _, demand, _ in bounds])
+        solver, assignments, stats, solve_time = self.solve(horizon, b_eq, A_ub, b_ub, upper_bounds, cancel_event)
+
+        days = [
+            self.model_result(model, assignments[horizon.day_columns(day)], missing, solver, stats, solve_time)
+            for day, (model, (_, _, missing)) in enumerate(zip(horizon.day_models, bounds))
+        ]
+        return {
+            'dates': horizon.dates,
+            'days': days,
+            'total_cost': float(np.dot(horizon.cost_vector, assignments)),
+            'missing_routes': missing_routes,
+            'solver': solver,
+            'mip_gap': stats.get('mip_gap') if solver == 'milp' else None,
+            'solve_time': solve_time,
+            'solver_stats': stats
+        }
+
+    @staticmethod
+    def horizon_run_id(demands):
+        """다일 수요 목록으로 정해지는 실행 ID를 만드는 함수 (같은 수요를 다시 실행하면 같은 ID)"""
+        key = sorted((str(entry['date']), entry['postal_code'], str(entry['truck_type']), entry['trucks'])
+                     for entry in demands)
+        return "horizon-" + hashlib.sha256(json.dumps(key, default=str).encode("utf-8")).hexdigest()[:16]
+
+    def roll_horizon(self, demands, progress=None, cancel_event=None, run_id=None):
+        """다일 계획을 한 번 풀고 첫 날짜만 Time 'YYYY-MM-DD 00:00:00'으로 확정하는 함수
+
+        plan_horizon의 결과에 확정한 날짜('committed')와 실행 ID('run_id')를 더해 돌려줍니다. 나머지 날짜는
+        저장하지 않는 잠정 결과이며, 다음 실행에서 새 가용 트럭 수로 다시 계획합니다 (날짜별 모델과 운임 인덱스는
+        재사용). 확정한 행에는 run_id(기본값은 수요로 정해지는 horizon_run_id)를 기록하고, 같은 run_id의 이전
+        확정분은 계획이 끝난 뒤 새 배차를 저장하는 트랜잭션 안에서 되돌리므로 계획이 실패하거나 취소되면 이전
+        확정분이 그대로 남고, 같은 계획을 다시 실행해도 트럭 수가 두 번 차감되지 않습니다.
+        """
+        run_id = run_id or self.horizon_run_id(demands)
+        horizon = self.plan_horizon(demands, progress, cancel_event)
+
+        date = horizon['dates'][0]
+        self.save_assignment_rows(self.assignment_rows(horizon['days'][0]), f"{date} 00:00:00", run_id, replace=True)
+        horizon['committed'] = date
+        horizon['run_id'] = run_id
+        return horizon
+
+    def optimize_shipping(self, model, truck_requirements, cancel_event=None):
+        """모델에 현재 제외 운송사와 가용 트럭 수를 반영하여 최적화하는 함수"""
+        upper_bounds, b_eq, missing_routes = self.route_bounds(model, truck_requirements)
+        if len(missing_routes) == len(model.route_ids):
+            raise OptimizationError("\n".join(
+                f"No data found for the postal code {destination} and truck type {truck_type}."
+                for destination, truck_type in missing_routes))
+
+        # 운송사 및 트럭 타입별로 제한을 설정 (저장/편집으로 바뀌었을 수 있으므로 매번 조회)
+        with self.metrics.stage("Carrier limits"):
+            A_ub, b_ub = self.capacity_bounds(model)
+
+        solver, assignments, stats, solve_time = self.solve(model, b_eq, A_ub, b_ub, upper_bounds, cancel_event)
+        return self.model_result(model, assignments, missing_routes, solver, stats, solve_time)
+
+    def capacity_bounds(self, model):
+        """모델의 용량 행마다 현재 가용 트럭 수를 조회해 (A_ub, b_ub)를 만드는 함수 (가용 트럭 정보가 없으면 (None, None))"""
+        carrier_limits = self.fetch_carrier_limits(model.unique_carriers, model.unique_truck_types)
+        if not carrier_limits:
+            return None, None
+        return model.A_ub, [carrier_limits.get(carrier, {}).get(truck_type, 0)
+                            for carrier, truck_type in model.capacity_pairs]
+
+    def analyze_sensitivity(self, demands, cancel_event=None):
+        """수요 목록의 계획을 LP로 한 번 풀어 쌍대값과 축소 비용으로 what-if 분석 결과를 만드는 함수
+
+        다시 풀지 않고도 다음을 알 수 있습니다 (우변이나 운임을 조금 바꿀 때 성립하는 1차 추정).
+        - 'capacities': (carrier, truck_type, 가용 트럭 수, 사용 트럭 수, 모두 사용했는지, 트럭 1대 추가 시 절감액)
+        - 'routes': (우편번호, 트럭 타입, 트럭 수, 트럭 1대 추가 시 비용 증가)
+        - 'alternatives': 선택되지 않은 후보마다 (우편번호, 트럭 타입, 운송사, 운임, 내려가야 하는 금액, 손익분기 운임)
+        입력 루트가 마지막 계산과 같으면 그 모델을 재사용합니다. cancel_event가 설정되면 풀이 전에 PlanningCancelled가
+        발생합니다.
+        """
+        input_destination = self.combine_routes(demands)
+        if not input_destination:
+            raise InputError("Please enter all fields including destination, truck count, and truck type.")
+        self.excluded_carriers.update(self.get_excluded_carriers())
+
+        route_ids = [(entry['postal_code'], entry['truck_type']) for entry in input_destination]
+        truck_requirements = [entry['trucks'] for entry in input_destination]
+        rate_index = self.get_rate_index()
+        model = self.last_model
+        if model is None or model.rate_index is not rate_index or model.route_ids != route_ids:
+            model = self.build_shipping_model(rate_index, route_ids)
+            self.last_model = model
+
+        upper_bounds, b_eq, missing_routes = self.route_bounds(model, truck_requirements)
+        if len(missing_routes) == len(model.route_ids):
+            raise OptimizationError("No shipping rates found for any of the routes.")
+        A_ub, b_ub = self.capacity_bounds(model)
+        check_cancelled(cancel_event)
+        x, demand_duals, capacity_duals, reduced_costs = solve_sensitivity(
+            model.cost_vector, model.A_eq, b_eq, A_ub, b_ub, upper_bounds)
+
+        capacities = []
+        if A_ub is not None:
+            used = A_ub @ x
+            for (carrier, truck_type), limit, trucks, dual in zip(model.capacity_pairs, b_ub, used, capacity_duals):
+                # 쌍대값은 가용 트럭이 늘 때의 총비용 변화 (0 이하)이므로 부호를 바꿔 절감액으로 표시
+                capacities.append((carrier, truck_type, int(limit), int(round(trucks)),
+                                   bool(trucks >= limit - 1e-6), max(-float(dual), 0.0)))
+
+        routes = [(postal_code, truck_type, int(trucks), float(dual))
+                  for (postal_code, truck_type), trucks, dual in zip(model.route_ids, b_eq, demand_duals)
+                  if trucks > 0]
+
+        # 제외되지 않았고 배차되지 않은 후보만 (축소 비용이 0이면 같은 비용의 대안)
+        candidates = model.candidates
+        alternatives = []
+        for i in np.flatnonzero((x < 0.5) & (upper_bounds > 0) & (b_eq[model.route_codes] > 0)).tolist():
+            postal_code, truck_type = candidates.route_ids[candidates.route_codes[i]]
+            cost = float(candidates.costs[i])
+            reduction = max(float(reduced_costs[i]), 0.0)
+            alternatives.append((postal_code, truck_type, candidates.carrier(i), cost, reduction, cost - reduction))
+        alternatives.sort(key=lambda row: row[4])
+
+        return {
+            'total_cost': float(np.dot(model.cost_vector, x)),
+            'capacities': capacities,
+            'routes': routes,
+            'alternatives': alternatives,
+            'missing_routes': missing_routes
+        }
+
+    def solve(self, model, b_eq, A_ub, b_ub, upper_bounds, cancel_event=None):
+        """모델을 (설정에 따라 병렬로) 풀고 (solver, 해, 통계, 풀이 시간)을 돌려주는 함수"""
+        solve_started = time.perf_counter()
+        with self.metrics.stage(PLAN_STAGES[-1]):
+            if (self.decompose and self.max_workers > 1 and model.num_data >= PROCESS_SOLVE_MIN_COLUMNS
+                    and len(model.components()) > 1):
+                solver, assignments, stats = self.run_solver_parallel(model, b_eq, b_ub, upper_bounds,
+                                                                      cancel_event)
+            else:
+                solver, assignments, stats = self.run_solver(
+                    (model.cost_vector, model.A_eq, b_eq, A_ub, b_ub, upper_bounds, self.integer_mode,
+                     self.mip_time_limit, self.mip_gap),
+                    cancel_event)
+        solve_time = time.perf_counter() - solve_started
+        self.metrics.solver = dict(stats, solver=solver, solve_time=solve_time)
+        return solver, assignments, stats, solve_time
+
+    def model_result(self, model, assignments, missing_routes, solver, stats, solve_time):
+        """모델의 열별 값과 해로 결과 딕셔너리를 만드는 함수"""
+        return {
+            'candidates': model.candidates,  # 열별 우편번호/운송사/트럭 타입/운임 (모델과 공유)
+            'assignments': assignments,
+            'total_cost': float(np.dot(model.cost_vector, assignments)),
+            'missing_routes': missing_routes,
+            'solver': solver,
+            'mip_gap': stats.get('mip_gap') if solver == 'milp' else None,
+            'solve_time': solve_time,
+            'solver_stats': stats
+        }
+
+    def run_solver(self, args, cancel_event=None):
+        """solve_model을 실행하는 함수
+
+        취소 가능한 큰 모델은 별도 프로세스에서 풀어, 취소 요청 시 HiGHS 풀이를 바로 중단(프로세스 종료)합니다.
+        작은 모델은 프로세스 시작 비용이 더 크므로 현재 스레드에서 풉니다.
+        """
+        check_cancelled(cancel_event)
+        if cancel_event is None or len(args[0]) < PROCESS_SOLVE_MIN_COLUMNS:
+            solved = solve_model(*args)
+            check_cancelled(cancel_event)
+            return solved
+
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=_solve_model_in_child, args=(sender, args), daemon=True)
+        process.start()
+        sender.close()  # 자식 프로세스가 비정상 종료하면 recv()에서 EOFError가 나도록 부모 쪽 송신 끝을 닫음
+        try:
+            while not receiver.poll(0.1):
+                if cancel_event.is_set():
+                    process.terminate()
+                    raise PlanningCancelled("The calculation was cancelled.")
+            try:
+                status, payload = receiver.recv()
+            except EOFError:
+                process.join()
+                raise OptimizationError(f"The solver process exited unexpectedly (exit code {process.exitcode}).")
+        finally:
+            receiver.close()
+            process.join()
+
+        if status == "error":
+            raise payload
+        return payload
+
+    def run_solver_parallel(self, model, b_eq, b_ub, upper_bounds, cancel_event=None):
+        """독립 부분 문제 묶음을 프로세스 풀에서 동시에 풀고 해를 하나로 합치는 함수
+
+        모든 묶음이 정수해를 찾은 경우에만 'milp'로 보고하며, MIP 갭은 묶음 중 가장 큰 값입니다.
+        """
+        check_cancelled(cancel_event)
+        if self.solver_pool is None:
+            self.solver_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        costs = model.cost_vector
+        b_eq = np.asarray(b_eq)
+        b_ub = None if b_ub is None else np.asarray(b_ub)
+
+        blocks = model.split(self.max_workers)
+        futures = []
+        for columns, eq_rows, ub_rows in blocks:
+            A_ub = None
+            if b_ub is not None and len(ub_rows):
+                A_ub = model.A_ub[ub_rows][:, columns]
+            futures.append(self.solver_pool.submit(
+                solve_model, costs[columns], model.A_eq[eq_rows][:, columns], b_eq[eq_rows], A_ub,
+                None if A_ub is None else b_ub[ub_rows], upper_bounds[columns], self.integer_mode,
+                self.mip_time_limit, self.mip_gap))
+
+        try:
+            pending = futures
+            while pending:
+                done, pending = wait(pending, timeout=0.1)
+                check_cancelled(cancel_event)
+        except PlanningCancelled:
+            # 이미 실행 중인 풀이는 중단할 수 없으므로 풀을 버리고 다음 계산에서 새로 만듦
+            self.solver_pool.shutdown(wait=False, cancel_futures=True)
+            self.solver_pool = None
+            raise
+
+        assignments = np.zeros(model.num_data)
+        solvers, stats_list = set(), []
+        for (columns, eq_rows, ub_rows), future in zip(blocks, futures):
+            solver, x, stats = future.result()  # 부분 문제의 OptimizationError는 그대로 전달됨
+            assignments[columns] = x
+            solvers.add(solver)
+            stats_list.append(stats)
+
+        stats = merge_solver_stats(stats_list)
+        if solvers == {'milp'}:
+            return 'milp', assignments, stats
+        stats.pop('mip_gap', None)
+        return 'lp', assignments, stats
+
+    def shutdown(self):
+        """병렬 풀이용 프로세스 풀을 종료하는 함수"""
+        if self.solver_pool is not None:
+            self.solver_pool.shutdown(cancel_futures=True)
+            self.solver_pool = None
+
+    def build_shipping_model(self, rate_index, route_ids):
+        """루트별 후보 운임(제외 운송사 포함) 배열을 이어 붙여 ShippingModel을 만드는 함수"""
+        segments = [rate_index.lookup_arrays(destination, truck_type) for destination, truck_type in route_ids]
+        counts = [len(costs) for _, costs in segments]
+        route_codes = np.repeat(np.arange(len(route_ids)), counts)
+        if segments:
+            carrier_codes = np.concatenate([codes for codes, _ in segments])
+            costs = np.concatenate([costs for _, costs in segments])
+        else:
+            carrier_codes, costs = _EMPTY_SEGMENT
+        return ShippingModel(route_ids, route_codes, carrier_codes, costs, rate_index)
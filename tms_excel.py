@@ -0,0 +1,150 @@
+import csv
+import zipfile
+from datetime import date, datetime
+from openpyxl import Workbook, load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from tms_engine import InputError
+
+TEMPLATE_HEADERS = ["Postal Code", "Total Trucks", "Truck Type"]  # 엑셀 템플릿의 헤더
+HORIZON_TEMPLATE_HEADERS = ["Date"] + TEMPLATE_HEADERS  # 여러 날짜 계획용 템플릿의 헤더
+RESULT_HEADERS = ["Input Postal Code", "Carrier", "Truck Type", "Assigned Trucks", "Cost"]
+
+
+def iter_template_rows(file_path, template_headers=TEMPLATE_HEADERS):
+    """템플릿(.xlsx 또는 .csv) 파일의 헤더를 검증하고 데이터 행을 순서대로 돌려주는 함수"""
+    if file_path.lower().endswith(".csv"):
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            headers = [value.strip() for value in next(reader, [])]
+            if headers != template_headers:
+                raise InputError("The selected file does not match the expected template format.")
+            for row in reader:
+                yield tuple(value.strip() for value in row)
+        return
+
+    try:
+        wb = load_workbook(filename=file_path, read_only=True, data_only=True)
+    except (InvalidFileException, zipfile.BadZipFile) as e:
+        raise InputError(f"Failed to read {file_path}: {e}") from e
+
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        headers = list(next(rows, ()))
+        while headers and headers[-1] is None:
+            headers.pop()  # 서식만 있는 빈 열은 무시
+        if headers != template_headers:
+            raise InputError("The selected file does not match the expected template format.")
+        yield from rows
+    finally:
+        wb.close()
+
+
+def iter_demands(file_path):
+    """템플릿 파일의 각 행을 {'postal_code', 'trucks', 'truck_type'} 수요로 변환하여 하나씩 돌려주는 함수"""
+    for row_number, row in enumerate(iter_template_rows(file_path), start=2):
+        postal_code, total_trucks, truck_type = (tuple(row) + (None, None, None))[:3]
+
+        if not all([postal_code, total_trucks, truck_type]):
+            continue  # 비어 있는 데이터는 건너뜀
+
+        try:
+            yield {
+                'postal_code': int(postal_code),
+                'trucks': int(total_trucks),
+                'truck_type': str(truck_type).strip()
+            }
+        except ValueError as e:
+            raise InputError(f"Invalid input in row {row_number}: {e}") from e
+
+
+def read_demands(file_path):
+    """템플릿 파일을 스트리밍으로 읽으면서 같은 postal code와 truck type의 트럭 수를 바로 합산하는 함수
+
+    셀 객체를 만들지 않고 값만 읽으므로 큰 파일도 적은 메모리로 처리됩니다.
+    파일에 처음 나온 순서대로 수요 목록을 돌려줍니다.
+    """
+    combined = {}  # (postal code, truck type) -> 수요
+    for demand in iter_demands(file_path):
+        key = (demand['postal_code'], demand['truck_type'])
+        if key in combined:
+            combined[key]['trucks'] += demand['trucks']
+        else:
+            combined[key] = demand
+    return list(combined.values())
+
+
+def parse_plan_date(value):
+    """엑셀 날짜 셀 또는 'YYYY-MM-DD' 문자열을 'YYYY-MM-DD' 문자열로 바꾸는 함수"""
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+
+
+def read_horizon_demands(file_path):
+    """Date 열이 있는 템플릿 파일을 읽어 같은 날짜, postal code, truck type의 트럭 수를 합산하는 함수
+
+    수요마다 'date' ('YYYY-MM-DD')가 추가되며, 파일에 처음 나온 순서대로 돌려줍니다.
+    """
+    combined = {}  # (date, postal code, truck type) -> 수요
+    for row_number, row in enumerate(iter_template_rows(file_path, HORIZON_TEMPLATE_HEADERS), start=2):
+        plan_date, postal_code, total_trucks, truck_type = (tuple(row) + (None,) * 4)[:4]
+
+        if not all([plan_date, postal_code, total_trucks, truck_type]):
+            continue  # 비어 있는 데이터는 건너뜀
+
+        try:
+            demand = {
+                'date': parse_plan_date(plan_date),
+                'postal_code': int(postal_code),
+                'trucks': int(total_trucks),
+                'truck_type': str(truck_type).strip()
+            }
+        except ValueError as e:
+            raise InputError(f"Invalid input in row {row_number}: {e}") from e
+
+        key = (demand['date'], demand['postal_code'], demand['truck_type'])
+        if key in combined:
+            combined[key]['trucks'] += demand['trucks']
+        else:
+            combined[key] = demand
+    return list(combined.values())
+
+
+def write_results_workbook(all_results, file_path):
+    """최적화 결과를 엑셀 파일로 저장하고 총 비용을 돌려주는 함수"""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Shipping Results"
+    total_cost = append_results(ws, all_results)
+    wb.save(file_path)
+    return total_cost
+
+
+def write_horizon_workbook(day_results, file_path):
+    """(date, 결과) 목록을 날짜별 시트로 저장하고 전체 총 비용을 돌려주는 함수"""
+    wb = Workbook()
+    wb.remove(wb.active)
+    total_cost = 0
+    for plan_date, all_results in day_results:
+        total_cost += append_results(wb.create_sheet(plan_date), all_results)
+    wb.save(file_path)
+    return total_cost
+
+
+def append_results(ws, all_results):
+    """시트에 결과 행과 총 비용을 추가하고 총 비용을 돌려주는 함수"""
+    # 엑셀 헤더 추가
+    ws.append(RESULT_HEADERS)
+
+    # 결과 데이터를 엑셀에 추가
+    total_cost = 0
+    for _, postal_code, carrier, truck_type, assigned_trucks, cost in all_results['candidates'].rows(
+            all_results['assignments']):
+        ws.append([postal_code, carrier, truck_type, assigned_trucks, f"{cost:,.2f}"])
+        total_cost += cost
+
+    # 총 비용을 엑셀에 추가
+    ws.append([])
+    ws.append(["", "", "", "Total Cost", f"{total_cost:,.2f}"])
+    return total_cost
@@ -0,0 +1,402 @@
+"""운임 인덱스와 엔진을 메모리에 유지하면서 HTTP/JSON으로 계획과 저장을 처리하는 로컬 계획 서비스
+
+한 호스트에서 서비스를 실행하고, 각 작업자 PC의 GUI는 TMS_SERVICE_URL을 설정하여 씬 클라이언트로 사용합니다.
+배차 저장(Carrier_assignment, available_trucks)은 서비스 안에서 한 번에 하나씩 처리되며,
+X-TMS-Token 헤더로 서비스와 같은 공유 토큰을 보낸 요청만 허용됩니다 (토큰 없이 실행하면 저장 불가).
+
+사용 예:
+    python tms_server.py --host 0.0.0.0 --port 8765 --token <공유 토큰>
+    set TMS_SERVICE_URL=http://dispatch-host:8765
+    set TMS_SERVICE_TOKEN=<공유 토큰>
+
+요청:
+    GET  /status  서비스 상태 (운임 행 수, 처리한 계획/저장 수)
+    POST /plan    {"demands": [{"postal_code", "trucks", "truck_type"}, ...]} -> 계획 결과
+    POST /commit  {"rows": [[postal_code, carrier, truck_type, assigned_trucks], ...]} -> {"saved": 행 수}
+    POST /what-if {"demands": [...]} -> what-if 분석 결과 (ShippingEngine.analyze_sensitivity)
+"""
+import argparse
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import tms_engine
+from tms_engine import (DATABASE_PATH, RATE_CACHE_DIR, RESULT_CACHE_DIR, MIP_TIME_LIMIT, MIP_REL_GAP,
+                        PERFORMANCE_LOG_PATH, PLAN_STAGES, CandidateStore, InputError, PlanMetrics, PlanningError,
+                        ShippingEngine, check_cancelled)
+
+SERVICE_PORT = 8765  # 계획 서비스 기본 포트
+SERVICE_TIMEOUT = 600  # 클라이언트가 계획 응답을 기다리는 최대 시간 (초)
+SERVICE_TOKEN_HEADER = "X-TMS-Token"  # 저장 요청에 필요한 공유 토큰 헤더
+TOKEN_PATHS = {"/commit"}  # DB를 바꾸는 요청 (공유 토큰 필요)
+
+
+class ServiceError(PlanningError):
+    """계획 서비스에 연결할 수 없거나 응답이 잘못된 경우"""
+    title = "Service Error"
+
+
+def result_to_json(result, metrics=None):
+    """계획 결과를 JSON으로 보낼 사전으로 바꾸는 함수 (배차된 열만 보냄)"""
+    candidates, assignments = result['candidates'], np.asarray(result['assignments'])
+    columns = np.flatnonzero(assignments > 0)
+    # 배차된 열의 운송사만 새 코드로 다시 매김
+    carrier_codes, column_carriers = np.unique(candidates.carrier_codes[columns], return_inverse=True)
+    return {
+        'routes': [list(route) for route in candidates.route_ids],
+        'carriers': [candidates.carrier_names[code] for code in carrier_codes.tolist()],
+        'columns': [[int(candidates.route_codes[i]), carrier, float(candidates.costs[i]), float(assignments[i])]
+                    for i, carrier in zip(columns.tolist(), column_carriers.reshape(-1).tolist())],
+        'total_cost': result['total_cost'],
+        'missing_routes': [list(route) for route in result['missing_routes']],
+        'solver': result['solver'],
+        'mip_gap': result['mip_gap'],
+        'solve_time': result['solve_time'],
+        'solver_stats': result['solver_stats'],
+        'metrics': None if metrics is None else metrics.as_dict()
+    }
+
+
+def analysis_from_json(data):
+    """what-if 분석 응답의 목록 행을 analyze_sensitivity와 같은 튜플 행으로 되돌리는 함수"""
+    return dict(data, **{key: [tuple(row) for row in data[key]]
+                         for key in ('capacities', 'routes', 'alternatives', 'missing_routes')})
+
+
+def result_from_json(data):
+    """result_to_json으로 받은 사전을 plan()과 같은 형식의 결과로 되돌리는 함수"""
+    columns = np.array(data['columns'], dtype=float).reshape(-1, 4)
+    candidates = CandidateStore([tuple(route) for route in data['routes']], columns[:, 0], columns[:, 1],
+                                columns[:, 2], data['carriers'])
+    return {
+        'candidates': candidates,
+        'assignments': columns[:, 3],
+        'total_cost': data['total_cost'],
+        'missing_routes': [tuple(route) for route in data['missing_routes']],
+        'solver': data['solver'],
+        'mip_gap': data['mip_gap'],
+        'solve_time': data['solve_time'],
+        'solver_stats': data['solver_stats']
+    }
+
+
+class PlanningService:
+    """하나의 ShippingEngine을 여러 클라이언트가 공유하도록 계획과 저장을 직렬화하는 클래스
+
+    HTTP 요청은 요청마다 새 스레드에서 처리되지만 연결 풀은 스레드별이므로, 엔진 작업은 계속 살아 있는 작업 스레드
+    (계획/what-if용 하나, 저장용 하나)에서 실행하여 공유 폴더의 DB 연결을 요청 사이에 재사용합니다.
+    """
+
+    def __init__(self, engine, perf_log=None):
+        self.engine = engine
+        self.perf_log = perf_log
+        # 엔진의 모델/성능 기록은 한 계획씩만 사용, 배차 저장은 한 번에 하나씩 (계획 중에도 저장 가능)
+        self.plan_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tms-plan")
+        self.commit_worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tms-commit")
+        self.started = datetime.now()
+        self.plans = 0
+        self.commits = 0
+
+    def warm_up(self):
+        """스키마를 맞추고 운임 인덱스를 미리 로드하는 함수 (계획 작업 스레드의 연결도 미리 엶)"""
+        def load():
+            self.engine.init_db()
+            self.engine.get_rate_index()
+        self.plan_worker.submit(load).result()
+
+    def shutdown(self):
+        """작업 스레드를 종료하는 함수 (진행 중인 작업은 끝까지 실행)"""
+        self.plan_worker.shutdown()
+        self.commit_worker.shutdown()
+
+    def status(self):
+        """서비스 상태를 돌려주는 함수"""
+        rate_index = self.engine.rate_index
+        return {
+            'started': self.started.isoformat(timespec="seconds"),
+            'rate_rows': rate_index.row_count if rate_index is not None else 0,
+            'plans': self.plans,
+            'commits': self.commits
+        }
+
+    @staticmethod
+    def read_demands(payload):
+        """요청의 수요 목록을 검사해 plan()에 넘길 형식으로 바꾸는 함수"""
+        demands = payload.get('demands')
+        if not isinstance(demands, list):
+            raise InputError("The request must contain a list of demands.")
+        try:
+            return [{'postal_code': int(entry['postal_code']), 'trucks': int(entry['trucks']),
+                     'truck_type': entry['truck_type']} for entry in demands]
+        except (KeyError, TypeError, ValueError) as e:
+            raise InputError(f"Invalid demand: {e}") from e
+
+    def plan(self, payload):
+        """수요 목록을 계획하고 JSON 결과를 돌려주는 함수"""
+        demands = self.read_demands(payload)
+
+        def run_plan():
+            # 다른 작업자가 제외 목록에서 지운 운송사도 반영되도록 계획마다 DB에서 다시 읽음
+            self.engine.excluded_carriers = set()
+            try:
+                result = self.engine.plan(demands)
+            finally:
+                metrics = self.engine.last_metrics
+                self.plans += 1
+                if self.perf_log and metrics is not None:
+                    try:
+                        metrics.write_log(self.perf_log)
+                    except OSError:
+                        pass
+            return result_to_json(result, metrics)
+        return self.plan_worker.submit(run_plan).result()
+
+    def what_if(self, payload):
+        """수요 목록의 what-if 분석(쌍대값, 축소 비용) 결과를 돌려주는 함수"""
+        demands = self.read_demands(payload)
+
+        def run_analysis():
+            self.engine.excluded_carriers = set()
+            return self.engine.analyze_sensitivity(demands)  # 튜플 행은 JSON 목록으로 보냄
+        return self.plan_worker.submit(run_analysis).result()
+
+    def commit(self, payload):
+        """배차 행을 저장하는 함수 (동시에 들어온 저장 요청은 순서대로 처리)"""
+        rows = payload.get('rows')
+        if not isinstance(rows, list):
+            raise InputError("The request must contain a list of assignment rows.")
+        try:
+            rows = [(int(postal_code), str(carrier), str(truck_type), int(assigned_trucks))
+                    for postal_code, carrier, truck_type, assigned_trucks in rows]
+        except (TypeError, ValueError) as e:
+            raise InputError(f"Invalid assignment row: {e}") from e
+
+        def run_commit():
+            saved = self.engine.save_assignment_rows(rows)
+            self.commits += 1
+            return saved
+        return {'saved': self.commit_worker.submit(run_commit).result()}
+
+
+class PlanningRequestHandler(BaseHTTPRequestHandler):
+    """계획 서비스의 HTTP 요청 처리기 (server.service에 PlanningService가 있어야 함)"""
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(200, self.server.service.status())
+        else:
+            self.send_json(404, {'error': {'type': "ServiceError", 'message': f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        handlers = {"/plan": self.server.service.plan, "/commit": self.server.service.commit,
+                    "/what-if": self.server.service.what_if}
+        handler = handlers.get(self.path)
+        if handler is None:
+            self.send_json(404, {'error': {'type': "ServiceError", 'message': f"Unknown path {self.path}"}})
+            return
+        if self.path in TOKEN_PATHS and not self.has_token():
+            message = ("Saving is disabled on this planning service; start it with --token to allow it."
+                       if self.server.token is None else "The request does not carry a valid service token.")
+            self.send_json(403, {'error': {'type': "ServiceError", 'message': message}})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            self.send_json(400, {'error': {'type': "InputError", 'message': f"Invalid JSON: {e}"}})
+            return
+
+        try:
+            self.send_json(200, handler(payload))
+        except PlanningError as e:
+            self.send_json(422, {'error': {'type': type(e).__name__, 'message': str(e)}})
+        except Exception as e:
+            self.send_json(500, {'error': {'type': "PlanningError", 'message': f"An unexpected error occurred: {e}"}})
+
+    def has_token(self):
+        """요청 헤더의 토큰이 서비스의 공유 토큰과 같은지 확인하는 함수 (서비스에 토큰이 없으면 항상 False)"""
+        token = self.headers.get(SERVICE_TOKEN_HEADER)
+        if self.server.token is None or token is None:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.server.token.encode("utf-8"))
+
+    def send_json(self, status, body):
+        """body를 JSON 응답으로 보내는 함수"""
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        """요청 기록을 한 줄씩 표준 오류로 출력하는 함수"""
+        print(f"{self.address_string()} - {format % args}", file=sys.stderr)
+
+
+class PlanningClient:
+    """GUI가 ShippingEngine 대신 사용하는 계획 서비스 클라이언트 (plan, analyze_sensitivity, save_assignments만 서비스에 요청)"""
+
+    def __init__(self, base_url, timeout=SERVICE_TIMEOUT, token=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token = token  # 저장 요청에 보내는 공유 토큰
+        self.last_metrics = None
+
+    def request(self, path, payload=None):
+        """JSON 요청을 보내고 응답 사전을 돌려주는 함수 (서비스의 오류는 같은 종류의 PlanningError로 발생)"""
+        data = None if payload is None else json.dumps(payload, default=str).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers[SERVICE_TOKEN_HEADER] = self.token
+        request = urllib.request.Request(f"{self.base_url}{path}", data=data, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.loads(e.read())['error']
+            except (ValueError, KeyError, TypeError):
+                raise ServiceError(f"The planning service returned HTTP {e.code}.") from e
+            error_class = getattr(tms_engine, error['type'], None)
+            if not (isinstance(error_class, type) and issubclass(error_class, PlanningError)):
+                error_class = ServiceError
+            raise error_class(error['message']) from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise ServiceError(f"Failed to reach the planning service at {self.base_url}: {e}") from e
+
+    def request_cancellable(self, path, payload, cancel_event=None):
+        """요청의 응답을 별도 스레드에서 기다리는 함수 (cancel_event가 설정되면 응답을 버리고 PlanningCancelled 발생)"""
+        reply = {}
+
+        def send():
+            try:
+                reply['data'] = self.request(path, payload)
+            except PlanningError as e:
+                reply['error'] = e
+
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        while sender.is_alive():
+            sender.join(0.1)
+            check_cancelled(cancel_event)
+
+        if 'error' in reply:
+            raise reply['error']
+        return reply['data']
+
+    def plan(self, demands, progress=None, cancel_event=None):
+        """ShippingEngine.plan과 같은 인터페이스로 서비스에 계획을 요청하는 함수
+
+        응답은 별도 스레드에서 기다리며, cancel_event가 설정되면 응답을 버리고 PlanningCancelled를 발생시킵니다.
+        """
+        if progress:
+            progress(PLAN_STAGES[0])
+        started = time.perf_counter()
+        self.last_metrics = None
+        data = self.request_cancellable("/plan", {'demands': demands}, cancel_event)
+        if data.get('metrics'):
+            self.last_metrics = PlanMetrics.from_dict(data['metrics'])
+            self.last_metrics.plan['round_trip_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return result_from_json(data)
+
+    def analyze_sensitivity(self, demands, cancel_event=None):
+        """ShippingEngine.analyze_sensitivity와 같은 인터페이스로 서비스에 what-if 분석을 요청하는 함수"""
+        return analysis_from_json(self.request_cancellable("/what-if", {'demands': demands}, cancel_event))
+
+    def save_assignments(self, result):
+        """배차 결과를 서비스에 저장 요청하는 함수 (저장한 행 수를 돌려줌)"""
+        rows = [[postal_code, carrier, truck_type, assigned_trucks]
+                for _, postal_code, carrier, truck_type, assigned_trucks, _ in
+                result['candidates'].rows(result['assignments'])]
+        if not rows:
+            return 0
+        return self.request("/commit", {'rows': rows})['saved']
+
+    def status(self):
+        """서비스 상태를 조회하는 함수"""
+        return self.request("/status")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Serve carrier assignment planning over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on (default: %(default)s; use 0.0.0.0 to serve other computers)")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="Port to listen on (default: %(default)s)")
+    parser.add_argument("--token", default=os.environ.get("TMS_SERVICE_TOKEN") or None,
+                        help="Shared token that clients must send to save assignments (default: TMS_SERVICE_TOKEN; "
+                             "without a token saving is disabled)")
+    parser.add_argument("--data-dir", default=DATABASE_PATH,
+                        help="Directory containing the TMS SQLite databases")
+    parser.add_argument("--cache-dir", default=RATE_CACHE_DIR,
+                        help="Read shipping rates from a local copy kept in this directory (default: %(default)s)")
+    parser.add_argument("--result-cache", nargs="?", const=RESULT_CACHE_DIR, default=None, metavar="DIR",
+                        help=f"Keep plan results on disk and reuse them for identical inputs, exclusions and "
+                             f"availability (default folder: {RESULT_CACHE_DIR})")
+    parser.add_argument("--wal", action="store_true",
+                        help="Use SQLite WAL journaling for the databases; only for a data directory on a local disk "
+                             "that no other computer opens (the setting is stored in the files)")
+    parser.add_argument("--lp", action="store_true",
+                        help="Solve the continuous LP only instead of integer dispatch (MILP)")
+    parser.add_argument("--time-limit", type=float, default=MIP_TIME_LIMIT,
+                        help="MILP time limit in seconds (default: %(default)s)")
+    parser.add_argument("--mip-gap", type=float, default=MIP_REL_GAP,
+                        help="MILP relative optimality gap (default: %(default)s)")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Split large plans into independent subproblems and solve them on all CPU cores")
+    parser.add_argument("--perf-log", nargs="?", const=PERFORMANCE_LOG_PATH, default=None, metavar="FILE",
+                        help=f"Append the performance record of every plan as a JSON line "
+                             f"(default file: {PERFORMANCE_LOG_PATH})")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    engine = ShippingEngine(args.data_dir, cache_dir=args.cache_dir, result_cache_dir=args.result_cache,
+                            wal=args.wal)
+    engine.integer_mode = not args.lp
+    engine.mip_time_limit = args.time_limit
+    engine.mip_gap = args.mip_gap
+    engine.decompose = args.parallel
+
+    service = PlanningService(engine, args.perf_log)
+    try:
+        service.warm_up()
+    except PlanningError as e:
+        print(f"{e.title}: {e}", file=sys.stderr)
+        service.shutdown()
+        tms_engine.close_all_connections()
+        return 1
+
+    server = ThreadingHTTPServer((args.host, args.port), PlanningRequestHandler)
+    server.service = service
+    server.token = args.token
+    print(f"Planning service listening on http://{args.host}:{args.port} "
+          f"({service.status()['rate_rows']} rate rows loaded)")
+    if args.token is None:
+        print("Saving is disabled; set --token or TMS_SERVICE_TOKEN to allow /commit.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+        engine.shutdown()
+        tms_engine.close_all_connections()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())